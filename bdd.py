@@ -0,0 +1,172 @@
+from utils import CONST
+
+
+class BDD:
+    """A manager of reduced ordered binary decision diagrams over arity variables.
+
+    Nodes are ints: FALSE (0) and TRUE (1) are the terminals, and every other node is an entry of the unique
+    table, so equivalent functions built in the same manager are the same node. Variable level 0 is the first
+    of the ordered variables, i.e. the most significant bit of a minterm. Operations go through ite, whose
+    results are cached in the computed table; its recursion is at most arity deep."""
+    FALSE = 0
+    TRUE = 1
+
+    def __init__(self, arity):
+        self.arity = arity
+        # level, low (variable is 0) and high (variable is 1) child of each node. Terminals are below every level.
+        self.levels = [arity, arity]
+        self.lows = [0, 1]
+        self.highs = [0, 1]
+        self.unique = {}
+        self.computed = {}
+
+    def __len__(self):
+        return len(self.levels)
+
+    def make(self, level, low, high):
+        """Return the node for "if variable level then high else low"."""
+        if low == high:
+            return low
+        key = (level, low, high)
+        node = self.unique.get(key)
+        if node is None:
+            node = len(self.levels)
+            self.levels.append(level)
+            self.lows.append(low)
+            self.highs.append(high)
+            self.unique[key] = node
+        return node
+
+    def var(self, level):
+        return self.make(level, BDD.FALSE, BDD.TRUE)
+
+    def ite(self, f, g, h):
+        """Return the node for "if f then g else h"."""
+        if f == BDD.TRUE:
+            return g
+        if f == BDD.FALSE:
+            return h
+        if g == h:
+            return g
+        if g == BDD.TRUE and h == BDD.FALSE:
+            return f
+        key = (f, g, h)
+        result = self.computed.get(key)
+        if result is None:
+            level = min(self.levels[f], self.levels[g], self.levels[h])
+            f_low, f_high = self.cofactors(f, level)
+            g_low, g_high = self.cofactors(g, level)
+            h_low, h_high = self.cofactors(h, level)
+            result = self.make(level, self.ite(f_low, g_low, h_low), self.ite(f_high, g_high, h_high))
+            self.computed[key] = result
+        return result
+
+    def cofactors(self, f, level):
+        if self.levels[f] == level:
+            return self.lows[f], self.highs[f]
+        return f, f
+
+    def negate(self, f):
+        return self.ite(f, BDD.FALSE, BDD.TRUE)
+
+    def conjoin(self, f, g):
+        return self.ite(f, g, BDD.FALSE)
+
+    def disjoin(self, f, g):
+        return self.ite(f, BDD.TRUE, g)
+
+    def xor(self, f, g):
+        return self.ite(f, self.negate(g), g)
+
+    def from_tree(self, tree, ordered_vars):
+        """Return the node of a syntax tree (of Nodes or DagNodes), whose variables are ordered_vars."""
+        levels = {var: level for level, var in enumerate(ordered_vars)}
+        nodes = {}
+        stack = [(tree, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if id(node) in nodes:
+                continue
+            if not children_done and not node.is_terminal():
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+                continue
+            if node.is_terminal():
+                if node.value in CONST:
+                    result = BDD.TRUE if node.value == "1" else BDD.FALSE
+                elif node.value in levels:
+                    result = self.var(levels[node.value])
+                else:
+                    raise ValueError("Invalid terminal value: " + str(node.value))
+            elif node.value == "+":
+                result = BDD.FALSE
+                for child in node.children:
+                    result = self.disjoin(result, nodes[id(child)])
+            elif node.value == ".":
+                result = BDD.TRUE
+                for child in node.children:
+                    result = self.conjoin(result, nodes[id(child)])
+            elif node.value == "~":
+                result = self.negate(nodes[id(node.child)])
+            else:
+                raise ValueError("Invalid node value: " + str(node.value))
+            nodes[id(node)] = result
+        return nodes[id(tree)]
+
+    def from_cubes(self, cubes):
+        """Return the node of the sum of cubes (Implicants, whose first variable is the most significant bit)."""
+        result = BDD.FALSE
+        for cube in cubes:
+            node = BDD.TRUE
+            for level in reversed(range(self.arity)):
+                bit = 1 << (self.arity - 1 - level)
+                if cube.mask & bit:
+                    continue
+                node = self.make(level, BDD.FALSE, node) if cube.value & bit else self.make(level, node, BDD.FALSE)
+            result = self.disjoin(result, node)
+        return result
+
+    def evaluate(self, f, minterm):
+        """Return the value of f for the input minterm (an int, the first variable being its most significant bit)."""
+        while f > BDD.TRUE:
+            f = self.highs[f] if minterm >> (self.arity - 1 - self.levels[f]) & 1 else self.lows[f]
+        return f == BDD.TRUE
+
+    def satcount(self, f):
+        """Return the number of minterms of f."""
+        counts = {BDD.FALSE: 0, BDD.TRUE: 1}
+        stack = [f]
+        while stack:
+            node = stack[-1]
+            if node in counts:
+                stack.pop()
+                continue
+            low, high = self.lows[node], self.highs[node]
+            if low not in counts or high not in counts:
+                stack.extend(child for child in (low, high) if child not in counts)
+                continue
+            stack.pop()
+            level = self.levels[node]
+            counts[node] = (counts[low] << (self.levels[low] - level - 1)) + \
+                           (counts[high] << (self.levels[high] - level - 1))
+        return counts[f] << self.levels[f]
+
+    def minterms(self, f):
+        """Yield the minterms of f in ascending order, without building them all up front."""
+        stack = [(f, 0, 0)]
+        while stack:
+            node, level, prefix = stack.pop()
+            if node == BDD.FALSE:
+                continue
+            if level == self.arity:
+                yield prefix
+            elif self.levels[node] > level:  # f does not depend on this variable.
+                stack.append((node, level + 1, prefix << 1 | 1))
+                stack.append((node, level + 1, prefix << 1))
+            else:
+                stack.append((self.highs[node], level + 1, prefix << 1 | 1))
+                stack.append((self.lows[node], level + 1, prefix << 1))
+
+    def any_minterm(self, f):
+        """Return the smallest minterm of f, or None if f is FALSE."""
+        return next(self.minterms(f), None)
@@ -0,0 +1,146 @@
+import argparse
+import gc
+import io
+import itertools
+import pickle
+import random
+import time
+
+from quine_mccluskey import QM
+from utils import Implicant, Parser
+
+
+def pairwise_combine_implicants(implicants):
+    """The all-pairs group scan that QM.combine_implicants used before it was hash indexed.
+    Kept as the reference point for the benchmark."""
+    prime_implicants = set()
+    level = set(implicants)
+    while level:
+        combined = set()
+        left_overs = set(level)
+        sorted_implicants = sorted(level, key=lambda implicant: implicant.n_ones)
+        grouped_implicants = [list(group) for key, group in itertools.groupby(sorted_implicants,
+                                                                              key=lambda implicant: implicant.n_ones)]
+        for group, next_group in zip(grouped_implicants, grouped_implicants[1:]):
+            for implicant in group:
+                for next_implicant in next_group:
+                    merged = implicant.merged(next_implicant)
+                    if merged is not None:
+                        left_overs.discard(implicant)
+                        left_overs.discard(next_implicant)
+                        combined.add(merged)
+        prime_implicants.update(left_overs)
+        level = combined
+    return prime_implicants
+
+
+def random_minterms(n_vars, density, rng):
+    return [minterm for minterm in range(2 ** n_vars) if rng.random() < density]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_combine(min_vars, max_vars, density, reference_max_vars, workers, seed):
+    rng = random.Random(seed)
+    print("{:>6} {:>10} {:>10} {:>12} {:>12} {:>8} {:>12}".format("vars", "minterms", "primes", "hashed (s)",
+                                                                 "pairwise (s)", "speedup", "parallel (s)"))
+    for n_vars in range(min_vars, max_vars + 1):
+        implicants = [Implicant.from_minterm(minterm) for minterm in random_minterms(n_vars, density, rng)]
+        primes, hashed_time = timed(QM.combine_implicants, implicants)
+        if n_vars <= reference_max_vars:
+            reference_primes, pairwise_time = timed(pairwise_combine_implicants, implicants)
+            assert primes == reference_primes
+            pairwise, speedup = "{:.3f}".format(pairwise_time), "{:.1f}x".format(pairwise_time / hashed_time)
+        else:
+            pairwise, speedup = "-", "-"
+        parallel = "-"
+        if workers > 1:
+            parallel_primes, parallel_time = timed(QM.combine_implicants, implicants, workers)
+            assert primes == parallel_primes
+            parallel = "{:.3f}".format(parallel_time)
+        print("{:>6} {:>10} {:>10} {:>12.3f} {:>12} {:>8} {:>12}".format(n_vars, len(implicants), len(primes),
+                                                                         hashed_time, pairwise, speedup, parallel))
+
+
+def bench_scaling(n_vars, density, max_workers, seed):
+    """Time QM.combine_implicants on one random function with 1, 2, 4, ... max_workers worker processes.
+    Also shows how much data the tasks of the first (largest) level send to the workers, relative to the
+    pickled level itself."""
+    rng = random.Random(seed)
+    implicants = [Implicant.from_minterm(minterm) for minterm in random_minterms(n_vars, density, rng)]
+    primes, serial_time = timed(QM.combine_implicants, implicants)
+    level_bytes = len(pickle.dumps(implicants))
+    print("{} vars, {} minterms, {} primes".format(n_vars, len(implicants), len(primes)))
+    print("{:>8} {:>10} {:>8} {:>8} {:>14}".format("workers", "time (s)", "speedup", "tasks", "payload/level"))
+    print("{:>8} {:>10.3f} {:>8} {:>8} {:>14}".format(1, serial_time, "1.0x", "-", "-"))
+    workers = 2
+    while workers <= max_workers:
+        parallel_primes, parallel_time = timed(QM.combine_implicants, implicants, workers)
+        assert primes == parallel_primes
+        tasks = QM.parallel_tasks(implicants, workers)
+        payload = sum(len(pickle.dumps(task)) for task in tasks) / level_bytes
+        print("{:>8} {:>10.3f} {:>7.1f}x {:>8} {:>13.2f}x".format(workers, parallel_time,
+                                                                  serial_time / parallel_time, len(tasks), payload))
+        workers *= 2
+
+
+def random_expression(n_chars, n_vars, rng):
+    """Return a sum of random parenthesized products of n_vars multi-character names, about n_chars long."""
+    products = []
+    length = 0
+    while length < n_chars:
+        literals = ["~" * rng.randint(0, 1) + "x{}".format(rng.randrange(n_vars)) for _ in range(rng.randint(1, 4))]
+        products.append("(" + ".".join(literals) + ")")
+        length += len(products[-1]) + 1
+    return "+".join(products)
+
+
+def bench_parse(megabytes, seed):
+    """Time parsing a generated expression, with the cyclic garbage collector on and off. Nodes make no
+    reference cycles (parents are weak references), so the collector only slows down building a large tree;
+    an application that parses large expressions may turn it off around Parser itself."""
+    rng = random.Random(seed)
+    expression = random_expression(int(megabytes * 1e6), 32, rng)
+    print("{:>10} {:>6} {:>12} {:>10}".format("input", "gc", "time (s)", "MB/s"))
+    for name, source in [("string", lambda: expression), ("stream", lambda: io.StringIO(expression))]:
+        for gc_enabled in (True, False):
+            if not gc_enabled:
+                gc.disable()
+            try:
+                _, seconds = timed(Parser, source())
+            finally:
+                gc.enable()
+            print("{:>10} {:>6} {:>12.3f} {:>10.2f}".format(name, "on" if gc_enabled else "off", seconds,
+                                                         len(expression) / seconds / 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Quine-McCluskey implementation.")
+    parser.add_argument("--min-vars", type=int, default=10)
+    parser.add_argument("--max-vars", type=int, default=20)
+    parser.add_argument("--density", type=float, default=0.5, help="fraction of inputs that are minterms")
+    parser.add_argument("--reference-max-vars", type=int, default=14,
+                        help="skip the (slow) all-pairs reference above this many variables")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="also time QM.combine_implicants with this many worker processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--parse-mb", type=float, default=0,
+                        help="instead, time parsing a generated expression of this many megabytes")
+    parser.add_argument("--scaling", type=int, default=0,
+                        help="instead, time combining at --max-vars with 1, 2, 4, ... up to this many workers")
+    args = parser.parse_args()
+    if args.parse_mb:
+        bench_parse(args.parse_mb, args.seed)
+        return
+    if args.scaling:
+        bench_scaling(args.max_vars, args.density, args.scaling, args.seed)
+        return
+    bench_combine(args.min_vars, args.max_vars, args.density, args.reference_max_vars, args.workers, args.seed)
+
+
+if __name__ == "__main__":
+    main()
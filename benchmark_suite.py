@@ -0,0 +1,163 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from quine_mccluskey import QM
+from utils import BooleanFunction, Parser
+
+STAGES = ("parse", "minterms", "prime_implicants", "essential_prime_implicants")
+
+
+def var_names(n_vars):
+    return BooleanFunction.default_var_names(n_vars)
+
+
+def random_product(names, n_literals, rng):
+    return "(" + ".".join("~" * rng.randint(0, 1) + name for name in rng.sample(names, n_literals)) + ")"
+
+
+def random_function(n_vars, rng):
+    """A sum of products of random lengths."""
+    names = var_names(n_vars)
+    return "+".join(random_product(names, rng.randint(1, n_vars), rng) for _ in range(2 * n_vars))
+
+
+def dense_function(n_vars, rng):
+    """Many short products, so most inputs are minterms."""
+    names = var_names(n_vars)
+    return "+".join(random_product(names, min(n_vars, 3), rng) for _ in range(3 * n_vars))
+
+
+def sparse_function(n_vars, rng):
+    """A few long products, so few inputs are minterms."""
+    names = var_names(n_vars)
+    return "+".join(random_product(names, max(n_vars - 2, 1), rng) for _ in range(n_vars))
+
+
+def parity_function(n_vars, rng):
+    """The XOR of all the variables (in a random order), which has 2 ** (n_vars - 1) prime implicants
+    and none of them merge."""
+    terms = var_names(n_vars)
+    rng.shuffle(terms)
+    while len(terms) > 1:
+        paired = ["(({0}).~({1}))+(~({0}).({1}))".format(a, b) for a, b in zip(terms[::2], terms[1::2])]
+        terms = paired + terms[len(paired) * 2:]
+    return terms[0]
+
+
+def cyclic_function(n_vars, rng):
+    """The sum of x_i.~x_i+1 around a ring of the variables: every input except all 0s and all 1s.
+    Each prime implicant x_i.~x_j covers many minterms and none is essential, so the whole table is a
+    cyclic core."""
+    names = var_names(n_vars)
+    rng.shuffle(names)
+    return "+".join("({}.~{})".format(a, b) for a, b in zip(names, names[1:] + names[:1]))
+
+
+FAMILIES = {"random": random_function, "dense": dense_function, "sparse": sparse_function,
+            "parity": parity_function, "cyclic": cyclic_function}
+
+
+def time_stages(expr_string):
+    """Return {stage: seconds} for one run of the exact pipeline on expr_string."""
+    seconds = {}
+    start = time.perf_counter()
+    tree = Parser(expr_string).syntax_tree
+    seconds["parse"] = time.perf_counter() - start
+    start = time.perf_counter()
+    BooleanFunction(tree).minterms
+    seconds["minterms"] = time.perf_counter() - start
+    quine_mccluskey = QM(expr_string)
+    quine_mccluskey.bool_fn.minterms
+    start = time.perf_counter()
+    quine_mccluskey.prime_implicants()
+    seconds["prime_implicants"] = time.perf_counter() - start
+    # the prime implicants are cached by now, so this times the table and the cover alone.
+    start = time.perf_counter()
+    quine_mccluskey.essential_prime_implicants(False)
+    seconds["essential_prime_implicants"] = time.perf_counter() - start
+    return seconds
+
+
+def run(families, min_vars, max_vars, repeat, seed):
+    """Time every stage for each family and number of variables, keeping the fastest of repeat runs.
+    Returns {"meta": ..., "results": {"family/n_vars": {stage: seconds}}}. The expressions only depend on
+    seed, family and n_vars, so results from different runs are comparable."""
+    results = {}
+    print("{:>16} {}".format("case", " ".join("{:>27}".format(stage) for stage in STAGES)))
+    for family in families:
+        for n_vars in range(min_vars, max_vars + 1):
+            rng = random.Random("{}/{}/{}".format(seed, family, n_vars))
+            expr_string = FAMILIES[family](n_vars, rng)
+            best = {}
+            for _ in range(repeat):
+                for stage, seconds in time_stages(expr_string).items():
+                    best[stage] = min(seconds, best.get(stage, seconds))
+            case = "{}/{}".format(family, n_vars)
+            results[case] = best
+            print("{:>16} {}".format(case, " ".join("{:>27.6f}".format(best[stage]) for stage in STAGES)))
+            sys.stdout.flush()
+    meta = {"python": platform.python_version(), "machine": platform.machine(), "seed": seed, "repeat": repeat}
+    return {"meta": meta, "results": results}
+
+
+def compare(baseline, current, threshold, min_seconds):
+    """Return [(case, stage, baseline seconds, current seconds)] for the stages that got slower by more than
+    threshold (a fraction: 0.2 is 20%). Stages faster than min_seconds in both runs are too noisy to compare."""
+    slowdowns = []
+    for case, stages in sorted(current["results"].items()):
+        for stage, seconds in sorted(stages.items()):
+            baseline_seconds = baseline["results"].get(case, {}).get(stage)
+            if baseline_seconds is None or max(seconds, baseline_seconds) < min_seconds:
+                continue
+            if seconds > baseline_seconds * (1 + threshold):
+                slowdowns.append((case, stage, baseline_seconds, seconds))
+    return slowdowns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each stage of the Quine-McCluskey pipeline over "
+                                                 "seeded families of functions, and compare runs.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    run_parser = commands.add_parser("run", help="time the suite and optionally save it as a JSON baseline")
+    run_parser.add_argument("-f", "--family", action="append", choices=sorted(FAMILIES),
+                            help="a family of functions to time (may be repeated, default: all)")
+    run_parser.add_argument("--min-vars", type=int, default=4)
+    run_parser.add_argument("--max-vars", type=int, default=12)
+    run_parser.add_argument("--repeat", type=int, default=3, help="keep the fastest of this many runs")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("-o", "--output", help="JSON file to write the results to")
+    compare_parser = commands.add_parser("compare", help="report the stages that got slower than a baseline")
+    compare_parser.add_argument("baseline", help="JSON file written by run")
+    compare_parser.add_argument("current", help="JSON file written by run")
+    compare_parser.add_argument("-t", "--threshold", type=float, default=0.2,
+                                help="slowdown to report, as a fraction (default: 0.2)")
+    compare_parser.add_argument("--min-seconds", type=float, default=0.001,
+                                help="ignore stages faster than this in both runs")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        families = args.family or sorted(FAMILIES)
+        results = run(families, args.min_vars, args.max_vars, args.repeat, args.seed)
+        if args.output is not None:
+            with open(args.output, "w") as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    slowdowns = compare(baseline, current, args.threshold, args.min_seconds)
+    for case, stage, baseline_seconds, seconds in slowdowns:
+        print("{:>16} {:>27} {:>12.6f} -> {:>12.6f} ({:+.0%})".format(case, stage, baseline_seconds, seconds,
+                                                                   seconds / baseline_seconds - 1))
+    print("{} slowdown(s) above {:.0%}".format(len(slowdowns), args.threshold))
+    return 1 if slowdowns else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import collections
+import hashlib
+import shelve
+
+from cover import BranchAndBoundCover
+from utils import Implicant, pack_bits
+
+
+class SimplifyCache:
+    """A bounded LRU cache of QM.simplify results, with an optional persistent tier on disk.
+
+    Entries are keyed on a fingerprint of the function rather than of the expression string, so
+    expressions with reordered operands, or with variables renamed in a way that keeps their sorted order,
+    share an entry. Up to MAX_TRUTH_TABLE_ARITY variables the fingerprint is the truth table (so any two
+    equivalent expressions share an entry); above it, it is the canonical form of the syntax tree.
+    In the exact mode the key also holds the cover solver and its settings, so e.g. a GreedyCover result is
+    never served to a request for a minimal cover.
+    The cached value is the list of chosen implicants, which is rendered with the variable names of the
+    function being simplified."""
+    MAX_TRUTH_TABLE_ARITY = 20
+
+    def __init__(self, maxsize=1024, path=None):
+        """path is the file name of the persistent tier (a shelve database). Without it the cache only
+        lives in memory."""
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.shelf = shelve.open(path) if path is not None else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(bool_fn, mode, cover_solver=None):
+        if mode == "exact":
+            mode += ":" + SimplifyCache.solver_key(cover_solver)
+        if bool_fn.arity <= SimplifyCache.MAX_TRUTH_TABLE_ARITY:
+            key = "t:{}:{}:{:x}:{:x}".format(mode, bool_fn.arity, bool_fn.truth_table(),
+                                             pack_bits(bool_fn.dont_cares, 2 ** bool_fn.arity))
+        elif bool_fn.tree is None:
+            key = "m:{}:{}:{}:{}".format(mode, bool_fn.arity, ",".join(map(str, bool_fn.minterms)),
+                                         ",".join(map(str, bool_fn.dont_cares)))
+        else:
+            # not canonical_key, whose order of children depends on the hash seed of the process.
+            key = "c:{}:{}".format(mode, bool_fn.tree.stable_digest())
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @staticmethod
+    def solver_key(cover_solver):
+        """Return the type and settings of a cover solver as a string. None is the default BranchAndBoundCover."""
+        if cover_solver is None:
+            cover_solver = BranchAndBoundCover()
+        return "{}{!r}".format(type(cover_solver).__name__, sorted(vars(cover_solver).items()))
+
+    def get(self, key):
+        """Return a copy of the cached implicants for key, or None."""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return list(self.entries[key])
+        if self.shelf is not None and key in self.shelf:
+            self.disk_hits += 1
+            implicants = [Implicant(value, mask) for value, mask in self.shelf[key]]
+            self._remember(key, implicants)
+            return list(implicants)
+        self.misses += 1
+        return None
+
+    def put(self, key, implicants):
+        implicants = list(implicants)
+        self._remember(key, implicants)
+        if self.shelf is not None:
+            self.shelf[key] = [tuple(implicant) for implicant in implicants]
+
+    def _remember(self, key, implicants):
+        self.entries[key] = implicants
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "size": len(self.entries),
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0}
+
+    def close(self):
+        if self.shelf is not None:
+            self.shelf.close()
+            self.shelf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
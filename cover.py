@@ -0,0 +1,197 @@
+import time
+
+from utils import Implicant, popcount, set_bits
+
+
+class CoverResult:
+    def __init__(self, cols, cost, optimal, nodes):
+        # The column indices of the chosen prime implicants.
+        self.cols = cols
+        # (number of products, number of literals) of the chosen prime implicants.
+        self.cost = cost
+        # True if no cover with fewer products (or as many products and fewer literals) exists.
+        self.optimal = optimal
+        # The number of search nodes expanded to find the cover.
+        self.nodes = nodes
+
+    def __repr__(self):
+        return "CoverResult(cols={}, cost={}, optimal={}, nodes={})".format(self.cols, self.cost, self.optimal,
+                                                                           self.nodes)
+
+
+class GreedyCover:
+    """Repeatedly choose the column that covers the most remaining rows. Fast, but not necessarily minimal."""
+    def solve(self, pit, initial_cols=None):
+        """initial_cols, a cover of the active rows, is returned instead when it is cheaper."""
+        cols = GreedyCover.cover(pit, pit.active_rows)
+        cost = cover_cost(pit, cols)
+        if initial_cols is not None and cover_cost(pit, initial_cols) < cost:
+            cols, cost = sorted(initial_cols), cover_cost(pit, initial_cols)
+        return CoverResult(cols, cost, optimal=False, nodes=0)
+
+    @staticmethod
+    def cover(pit, rows):
+        """Return a list of active columns that covers the rows in the bitset rows, with redundant columns removed."""
+        chosen = []
+        remaining = rows
+        while remaining:
+            col_index = max(pit.col_indices(),
+                            key=lambda col_index: (popcount(pit.cols[col_index] & remaining),
+                                                   -literal_count(pit, col_index)))
+            if pit.cols[col_index] & remaining == 0:
+                raise ValueError("The rows can not be covered by the active columns")
+            chosen.append(col_index)
+            remaining &= ~pit.cols[col_index]
+        for col_index in list(reversed(chosen)):
+            others = 0
+            for other_col_index in chosen:
+                if other_col_index != col_index:
+                    others |= pit.cols[other_col_index]
+            if rows & ~others == 0:
+                chosen.remove(col_index)
+        return sorted(chosen)
+
+
+class BranchAndBoundCover:
+    """Find a minimum cover of the active rows of a PrimeImplicantTable by depth first branch and bound.
+    Covers are compared by number of products, then by number of literals.
+
+    At each node the uncovered row with the fewest covering columns is chosen, and the search branches
+    on each column that covers it. A branch is pruned when its cost plus a lower bound (the size of a set
+    of uncovered rows that pairwise share no column) can not beat the best cover found so far, or when
+    the same set of uncovered rows has already been reached at no greater cost. The greedy cover is the
+    starting upper bound, so a cover is returned even when the search runs out of max_nodes or
+    time_limit (in seconds), in which case it is not marked optimal."""
+    def __init__(self, max_nodes=20000, time_limit=None):
+        self.max_nodes = max_nodes
+        self.time_limit = time_limit
+
+    def solve(self, pit, initial_cols=None):
+        """initial_cols may be a known cover (e.g. a previous solution) to use as the starting upper bound.
+        Rows that share no columns, directly or through other rows, are solved as separate components."""
+        deadline = None if self.time_limit is None else time.perf_counter() + self.time_limit
+        cols = []
+        optimal = True
+        nodes = 0
+        for rows in BranchAndBoundCover.components(pit):
+            component_initial_cols = None
+            if initial_cols is not None:
+                component_initial_cols = [col_index for col_index in initial_cols if pit.cols[col_index] & rows]
+            max_nodes = None if self.max_nodes is None else max(self.max_nodes - nodes, 0)
+            component_cols, component_optimal, component_nodes = BranchAndBoundCover.solve_rows(
+                pit, rows, component_initial_cols, max_nodes, deadline)
+            cols.extend(component_cols)
+            optimal = optimal and component_optimal
+            nodes += component_nodes
+        return CoverResult(sorted(cols), cover_cost(pit, cols), optimal, nodes)
+
+    @staticmethod
+    def components(pit):
+        """Yield the active rows split into bitsets of rows that are connected through shared columns."""
+        unvisited = pit.active_rows
+        while unvisited:
+            component = frontier = unvisited & -unvisited
+            visited_cols = 0
+            while frontier:
+                cols = 0
+                for row_index in set_bits(frontier):
+                    cols |= pit.row_bits(row_index)
+                cols &= ~visited_cols
+                visited_cols |= cols
+                reached = 0
+                for col_index in set_bits(cols):
+                    reached |= pit.col_bits(col_index)
+                frontier = reached & ~component
+                component |= reached
+            unvisited &= ~component
+            yield component
+
+    @staticmethod
+    def solve_rows(pit, rows, initial_cols, max_nodes, deadline):
+        """Return (cols, optimal, nodes) for a minimum cover of the bitset rows."""
+        col_costs = {col_index: (1, literal_count(pit, col_index)) for col_index in pit.col_indices()
+                     if pit.cols[col_index] & rows}
+        if initial_cols is None or rows & ~union(pit, initial_cols) != 0:
+            initial_cols = GreedyCover.cover(pit, rows)
+        best_cols = sorted(initial_cols)
+        best_cost = cover_cost(pit, best_cols)
+        if not col_costs:
+            return best_cols, rows == 0, 0
+        min_literals = min(literals for products, literals in col_costs.values())
+        # rows with the fewest covering columns first, both for branching and for the lower bound.
+        row_order = sorted(((row_index, pit.row_bits(row_index)) for row_index in set_bits(rows)),
+                           key=lambda item: popcount(item[1]))
+        cheapest_cost_seen = {}
+        nodes = 0
+        exhausted = False
+        stack = [(rows, (), (0, 0))]
+        while stack:
+            if (max_nodes is not None and nodes >= max_nodes or
+                    deadline is not None and time.perf_counter() > deadline):
+                exhausted = True
+                break
+            remaining, chosen, cost = stack.pop()
+            nodes += 1
+            if remaining == 0:
+                if cost < best_cost:
+                    best_cols, best_cost = sorted(chosen), cost
+                continue
+            if cheapest_cost_seen.get(remaining, best_cost) <= cost:
+                continue
+            cheapest_cost_seen[remaining] = cost
+            # the uncovered rows that pairwise share no column each need a different column,
+            # so their number is a lower bound on the products still needed.
+            bound = 0
+            used_cols = 0
+            branch_row = None
+            for row_index, row in row_order:
+                if remaining >> row_index & 1 and row & used_cols == 0:
+                    if branch_row is None:
+                        branch_row = row
+                    used_cols |= row
+                    bound += 1
+            if (cost[0] + bound, cost[1] + bound * min_literals) >= best_cost:
+                continue
+            # push the most promising column last, so that it is expanded first.
+            for col_index in sorted(set_bits(branch_row),
+                                    key=lambda col_index: (popcount(pit.cols[col_index] & remaining),
+                                                           -col_costs[col_index][1])):
+                col_cost = col_costs[col_index]
+                stack.append((remaining & ~pit.cols[col_index], chosen + (col_index,),
+                              (cost[0] + col_cost[0], cost[1] + col_cost[1])))
+        return best_cols, not exhausted, nodes
+
+
+class WarmStartCover:
+    """Start solver (GreedyCover or BranchAndBoundCover, whose solve takes initial_cols) from a previous solution.
+    The previous columns that are still active, completed greedily to a cover of the active rows,
+    are the starting upper bound."""
+    def __init__(self, solver, previous_cols):
+        self.solver = solver
+        self.previous_cols = previous_cols
+
+    def solve(self, pit):
+        cols = [col_index for col_index in self.previous_cols if pit.active_cols >> col_index & 1]
+        uncovered = pit.active_rows & ~union(pit, cols)
+        if uncovered:
+            cols.extend(GreedyCover.cover(pit, uncovered))
+        return self.solver.solve(pit, initial_cols=cols)
+
+
+def literal_count(pit, col_index):
+    implicant = pit.all_prime_implicants[col_index]
+    if isinstance(implicant, str):
+        implicant = Implicant.from_bitstring(implicant)
+    return pit.arity - popcount(implicant.mask)
+
+
+def union(pit, cols):
+    """Return the bitset of the rows covered by any of the columns in cols."""
+    covered = 0
+    for col_index in cols:
+        covered |= pit.cols[col_index]
+    return covered
+
+
+def cover_cost(pit, cols):
+    return len(cols), sum(literal_count(pit, col_index) for col_index in cols)
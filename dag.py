@@ -0,0 +1,96 @@
+from utils import Node
+
+
+class DagNode:
+    """A node of an expression DAG. DagNodes are immutable and are only made by a NodeStore, which stores
+    every distinct subexpression once, so two DagNodes from the same store are structurally equal
+    (ignoring the order of children) exactly when they are the same object.
+
+    DagNode has the read-only part of the Node API (value, children, child, is_terminal), so the tree walks
+    in BooleanFunction and Espresso work on either."""
+    __slots__ = ("value", "children", "uid", "_key", "_hash")
+
+    def __init__(self, value, children, uid):
+        self.value = value
+        self.children = children
+        self.uid = uid
+        self._key = None
+        self._hash = None
+
+    @property
+    def child(self):
+        if len(self.children) == 1:
+            return self.children[0]
+        else:
+            raise ValueError("self does not have exactly 1 child")
+
+    def is_terminal(self):
+        return len(self.children) == 0
+
+    def canonical_key(self):
+        """Return the same key as Node.canonical_key of the equivalent tree."""
+        if self._key is None:
+            stack = [(self, False)]
+            while stack:
+                node, children_done = stack.pop()
+                if node._key is not None:
+                    continue
+                if not children_done:
+                    stack.append((node, True))
+                    stack.extend((child, False) for child in node.children if child._key is None)
+                    continue
+                children = sorted(node.children, key=lambda child: (child._hash, child._key))
+                node._key = (node.value, tuple(child._key for child in children))
+                node._hash = hash((node.value, tuple(child._hash for child in children)))
+        return self._key
+
+    def __repr__(self):
+        return "DagNode({!r}, uid={})".format(self.value, self.uid)
+
+
+class NodeStore:
+    """A hash-consing store of DagNodes: node(value, children) returns the existing node for the
+    subexpression if there is one. Children of a node are kept sorted by uid, so the operands of "+" and "."
+    are unordered, like in Node.__eq__."""
+
+    def __init__(self):
+        self.nodes = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def node(self, value, children=()):
+        children = tuple(sorted(children, key=lambda child: child.uid))
+        key = (value, tuple(child.uid for child in children))
+        node = self.nodes.get(key)
+        if node is None:
+            node = DagNode(value, children, len(self.nodes))
+            self.nodes[key] = node
+        return node
+
+    def from_tree(self, tree):
+        """Intern a Node tree, returning its root DagNode."""
+        interned = {}
+        stack = [(tree, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if not children_done and not node.is_terminal():
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+                continue
+            interned[id(node)] = self.node(node.value, [interned[id(child)] for child in node.children])
+        return interned[id(tree)]
+
+    @staticmethod
+    def to_tree(dag_node):
+        """Expand a DagNode into a new Node tree. Shared subexpressions become separate subtrees."""
+        root = Node(dag_node.value)
+        stack = [(dag_node, root)]
+        while stack:
+            source, target = stack.pop()
+            if source.is_terminal():
+                continue
+            children = [Node(child.value) for child in source.children]
+            target.children = children
+            stack.extend(zip(source.children, children))
+        return root
@@ -0,0 +1,55 @@
+import collections
+
+from bdd import BDD
+from utils import BooleanFunction, Implicant, Parser, pack_bits
+
+
+class Equivalence(collections.namedtuple("Equivalence", ["equivalent", "counterexample"])):
+    """The result of an equivalence check. It is truthy when the functions are equivalent; otherwise
+    counterexample maps each variable to the 0 or 1 of an input on which the functions differ."""
+    __slots__ = ()
+
+    def __bool__(self):
+        return self.equivalent
+
+
+# Up to this many variables, equivalence is checked on truth tables; above it, on BDDs.
+EQUIVALENCE_TRUTH_TABLE_ARITY = 20
+
+
+def equivalent(expr_a, expr_b):
+    """Return an Equivalence telling whether the expressions compute the same function of the union
+    of their variables."""
+    tree_a, tree_b = Parser(expr_a).syntax_tree, Parser(expr_b).syntax_tree
+    var_names = sorted(set(BooleanFunction(tree_a).ordered_unique_vars) |
+                       set(BooleanFunction(tree_b).ordered_unique_vars))
+    return check_equivalence(BooleanFunction(tree_a, var_names), BooleanFunction(tree_b, var_names))
+
+
+def check_equivalence(bool_fn_a, bool_fn_b, dont_cares=()):
+    """Return an Equivalence telling whether two boolean functions over the same variables agree on every
+    input except the dont_cares. Up to EQUIVALENCE_TRUTH_TABLE_ARITY variables the packed truth tables are
+    XORed; above it, both functions are built in one BDD manager, where equivalent functions are the same node."""
+    arity = bool_fn_a.arity
+    if arity <= EQUIVALENCE_TRUTH_TABLE_ARITY:
+        difference = bool_fn_a.truth_table() ^ bool_fn_b.truth_table()
+        difference &= ~pack_bits(dont_cares, 2 ** arity)
+        counterexample = (difference & -difference).bit_length() - 1 if difference else None
+    else:
+        manager = BDD(arity)
+        difference = manager.xor(function_bdd(manager, bool_fn_a), function_bdd(manager, bool_fn_b))
+        if dont_cares:
+            cubes = [Implicant.from_minterm(minterm) for minterm in dont_cares]
+            difference = manager.conjoin(difference, manager.negate(manager.from_cubes(cubes)))
+        counterexample = manager.any_minterm(difference)
+    if counterexample is None:
+        return Equivalence(True, None)
+    values = bool_fn_a.product_as_bitstring(counterexample) if arity else ""
+    return Equivalence(False, {var: int(value) for var, value in zip(bool_fn_a.ordered_unique_vars, values)})
+
+
+def function_bdd(manager, bool_fn):
+    """Return the node of bool_fn in manager, built from its tree or, without one, from its minterms."""
+    if bool_fn.tree is None:
+        return manager.from_cubes(Implicant.from_minterm(minterm) for minterm in bool_fn.iter_minterms())
+    return manager.from_tree(bool_fn.tree, bool_fn.ordered_unique_vars)
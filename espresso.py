@@ -0,0 +1,252 @@
+from utils import CONST, Implicant, popcount, set_bits
+
+
+class Espresso:
+    """Heuristic two-level minimizer in the style of Espresso.
+
+    Functions are handled as covers (lists of Implicants, i.e. cubes) instead of truth tables, so memory
+    scales with the size of the covers rather than with 2 ** arity. Starting from the on-set cover, the
+    cover is expanded into prime cubes that stay inside the on-set and don't cares, made irredundant, and then repeatedly
+    reduced, re-expanded and made irredundant again for as long as that lowers its cost.
+    The result is a cover of prime implicants, but not necessarily a minimum one."""
+    def __init__(self, arity, on_cover, dc_cover=()):
+        self.arity = arity
+        self.full = (1 << arity) - 1
+        self.on_cover = list(on_cover)
+        self.dc_cover = list(dc_cover)
+
+    @classmethod
+    def from_tree(cls, tree, ordered_vars):
+        """Make an Espresso from a syntax tree, converting it to a cover without building a truth table.
+        The first of ordered_vars is the most significant bit of a cube."""
+        arity = len(ordered_vars)
+        full = (1 << arity) - 1
+        bits = {var: 1 << (arity - 1 - index) for index, var in enumerate(ordered_vars)}
+        covers = {}
+        stack = [(tree, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if id(node) in covers:
+                continue
+            if not children_done and not node.is_terminal():
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+                continue
+            if node.is_terminal():
+                if node.value in CONST:
+                    cover = [Implicant(0, full)] if node.value == "1" else []
+                elif node.value in bits:
+                    cover = [Implicant(bits[node.value], full & ~bits[node.value])]
+                else:
+                    raise ValueError("Invalid terminal value: " + str(node.value))
+            elif node.value == "+":
+                cover = []
+                for child in node.children:
+                    cover.extend(covers[id(child)])
+                cover = Espresso.single_cube_containment(cover)
+            elif node.value == ".":
+                cover = [Implicant(0, full)]
+                for child in node.children:
+                    cover = Espresso.intersect_covers(cover, covers[id(child)])
+            elif node.value == "~":
+                cover = Espresso.complement(covers[id(node.child)], full)
+            else:
+                raise ValueError("Invalid node value: " + str(node.value))
+            covers[id(node)] = cover
+        return cls(arity, covers[id(tree)])
+
+    def minimize(self):
+        """Return a cover of prime implicants of the function."""
+        care_cover = self.on_cover + self.dc_cover
+        cover = self.irredundant(self.expand(self.on_cover, care_cover))
+        cost = Espresso.cost(cover, self.full)
+        while True:
+            new_cover = self.irredundant(self.expand(self.reduce(cover), care_cover))
+            new_cost = Espresso.cost(new_cover, self.full)
+            if new_cost >= cost:
+                return cover
+            cover, cost = new_cover, new_cost
+
+    def expand(self, cover, care_cover):
+        """Replace each cube by a prime cube containing it, by turning literals into dashes for as long as
+        the cube stays inside care_cover (the on-set and don't cares). This is checked with a tautology test
+        on the cofactor rather than against a complemented off-set, which can be exponentially larger.
+        Cubes contained in an already expanded cube are dropped.
+        Larger cubes are expanded first, and literals are raised in the order that lets the expanded
+        cube contain the most other cubes."""
+        expanded = []
+        remaining = sorted(cover, key=lambda cube: -popcount(cube.mask))
+        while remaining:
+            cube = remaining.pop(0)
+            if any(prime.contains(cube) for prime in expanded):
+                continue
+            for bit in sorted(set_bits(self.full & ~cube.mask),
+                              key=lambda bit: -sum(1 for other in remaining
+                                                   if (other.mask | (other.value ^ cube.value)) >> bit & 1)):
+                raised = Implicant(cube.value & ~(1 << bit), cube.mask | 1 << bit)
+                if Espresso.cover_contains(care_cover, raised, self.full):
+                    cube = raised
+            expanded.append(cube)
+            remaining = [other for other in remaining if not cube.contains(other)]
+        return expanded
+
+    def irredundant(self, cover):
+        """Remove cubes that are covered by the rest of the cover together with the don't cares.
+        The smallest cubes are considered for removal first."""
+        cover = sorted(cover, key=lambda cube: popcount(cube.mask))
+        index = 0
+        while index < len(cover):
+            rest = cover[:index] + cover[index + 1:] + self.dc_cover
+            if Espresso.cover_contains(rest, cover[index], self.full):
+                cover.pop(index)
+            else:
+                index += 1
+        return cover
+
+    def reduce(self, cover):
+        """Shrink each cube to the smallest cube containing the part of it that no other cube
+        (or don't care) covers. Cubes that become empty are dropped."""
+        reduced = list(cover)
+        for index in sorted(range(len(reduced)), key=lambda index: -popcount(reduced[index].mask)):
+            cube = reduced[index]
+            rest = [other for other_index, other in enumerate(reduced)
+                    if other_index != index and other is not None] + self.dc_cover
+            uncovered = Espresso.complement_supercube(Espresso.cofactor(rest, cube, self.full), self.full)
+            reduced[index] = None if uncovered is None else Espresso.intersect(cube, uncovered)
+        return [cube for cube in reduced if cube is not None]
+
+    @staticmethod
+    def cost(cover, full):
+        return len(cover), sum(popcount(full & ~cube.mask) for cube in cover)
+
+    @staticmethod
+    def intersects(x, y):
+        return (x.value ^ y.value) & ~x.mask & ~y.mask == 0
+
+    @staticmethod
+    def intersect(x, y):
+        """Return the cube of the minterms shared by cubes x and y, or None if there are none."""
+        if not Espresso.intersects(x, y):
+            return None
+        return Implicant(x.value | y.value, x.mask & y.mask)
+
+    @staticmethod
+    def supercube(cover, full):
+        """Return the smallest cube containing every cube in the (non-empty) cover."""
+        value, mask = cover[0]
+        for cube in cover[1:]:
+            mask |= cube.mask | (value ^ cube.value)
+        return Implicant(value & ~mask, mask & full)
+
+    @staticmethod
+    def intersect_covers(x, y):
+        return Espresso.single_cube_containment([cube for cube in (Espresso.intersect(x_cube, y_cube)
+                                                                   for x_cube in x for y_cube in y)
+                                                 if cube is not None])
+
+    @staticmethod
+    def single_cube_containment(cover):
+        """Remove duplicate cubes and cubes contained in another cube of the cover."""
+        kept = []
+        for cube in sorted(set(cover), key=lambda cube: -popcount(cube.mask)):
+            if not any(other.contains(cube) for other in kept):
+                kept.append(cube)
+        return kept
+
+    @staticmethod
+    def cofactor(cover, cube, full):
+        """Return the cofactor of the cover with respect to cube: the cubes intersecting cube,
+        with the variables that cube fixes turned into dashes."""
+        fixed = full & ~cube.mask
+        return [Implicant(other.value & ~fixed, other.mask | fixed) for other in cover
+                if Espresso.intersects(other, cube)]
+
+    @staticmethod
+    def cofactor_literal(cover, bit, polarity):
+        """Return the cofactor of the cover with respect to the variable at bit being polarity (0 or 1)."""
+        mask = 1 << bit
+        return [Implicant(cube.value & ~mask, cube.mask | mask) for cube in cover
+                if cube.mask & mask or (cube.value >> bit & 1) == polarity]
+
+    @staticmethod
+    def splitting_bit(cover, full):
+        """Return (bit, is_binate) for the variable that appears in the most cubes, preferring variables that
+        appear in both polarities."""
+        ones = {}
+        zeros = {}
+        for cube in cover:
+            for bit in set_bits(full & ~cube.mask):
+                if cube.value >> bit & 1:
+                    ones[bit] = ones.get(bit, 0) + 1
+                else:
+                    zeros[bit] = zeros.get(bit, 0) + 1
+        bit = max(set(ones).union(zeros), key=lambda bit: (bit in ones and bit in zeros,
+                                                            ones.get(bit, 0) + zeros.get(bit, 0)))
+        return bit, bit in ones and bit in zeros
+
+    @staticmethod
+    def tautology(cover, full):
+        """Returns True if the cover contains every minterm."""
+        if not cover:
+            return False
+        if any(cube.mask == full for cube in cover):
+            return True
+        bit, is_binate = Espresso.splitting_bit(cover, full)
+        if not is_binate:
+            # in a cover that is unate in the variable, the cofactor without the literal is contained in the
+            # cofactor with it, so the cover is a tautology iff that smaller cofactor is one.
+            polarity = 0 if any(cube.value >> bit & 1 for cube in cover if not cube.mask >> bit & 1) else 1
+            return Espresso.tautology(Espresso.cofactor_literal(cover, bit, polarity), full)
+        return (Espresso.tautology(Espresso.cofactor_literal(cover, bit, 1), full) and
+                Espresso.tautology(Espresso.cofactor_literal(cover, bit, 0), full))
+
+    @staticmethod
+    def cover_contains(cover, cube, full):
+        """Returns True if every minterm of cube is covered by the cover."""
+        return Espresso.tautology(Espresso.cofactor(cover, cube, full), full)
+
+    @staticmethod
+    def complement_supercube(cover, full):
+        """Return the smallest cube containing every minterm not covered by the cover, or None if the
+        cover is a tautology. Only one cube is carried up each level of the Shannon expansion, so the
+        (possibly much larger) complement itself is never built."""
+        if not cover:
+            return Implicant(0, full)
+        if any(cube.mask == full for cube in cover):
+            return None
+        if len(cover) == 1:
+            cube = cover[0]
+            literals = full & ~cube.mask
+            if literals & (literals - 1) == 0:
+                return Implicant(~cube.value & literals, full & ~literals)
+            return Implicant(0, full)
+        bit, is_binate = Espresso.splitting_bit(cover, full)
+        mask = 1 << bit
+        cubes = []
+        positive = Espresso.complement_supercube(Espresso.cofactor_literal(cover, bit, 1), full)
+        if positive is not None:
+            cubes.append(Implicant(positive.value | mask, positive.mask & ~mask))
+        negative = Espresso.complement_supercube(Espresso.cofactor_literal(cover, bit, 0), full)
+        if negative is not None:
+            cubes.append(Implicant(negative.value, negative.mask & ~mask))
+        return Espresso.supercube(cubes, full) if cubes else None
+
+    @staticmethod
+    def complement(cover, full):
+        """Return a cover of the minterms not covered by the cover, by recursive Shannon expansion."""
+        if not cover:
+            return [Implicant(0, full)]
+        if any(cube.mask == full for cube in cover):
+            return []
+        if len(cover) == 1:
+            cube = cover[0]
+            return [Implicant(~cube.value & 1 << bit, full & ~(1 << bit)) for bit in set_bits(full & ~cube.mask)]
+        bit, is_binate = Espresso.splitting_bit(cover, full)
+        mask = 1 << bit
+        positive = Espresso.complement(Espresso.cofactor_literal(cover, bit, 1), full)
+        negative = Espresso.complement(Espresso.cofactor_literal(cover, bit, 0), full)
+        shared = set(positive).intersection(negative)
+        return Espresso.single_cube_containment(
+            list(shared) +
+            [Implicant(cube.value | mask, cube.mask & ~mask) for cube in positive if cube not in shared] +
+            [Implicant(cube.value, cube.mask & ~mask) for cube in negative if cube not in shared])
@@ -0,0 +1,214 @@
+from cover import BranchAndBoundCover, WarmStartCover
+from quine_mccluskey import QM
+from utils import BooleanFunction, Implicant, PrimeImplicantTable, check_terms, popcount, set_bits
+
+
+class IncrementalQM:
+    """A minimizer for a function that changes by a few minterms at a time.
+
+    The prime implicants and the prime implicant table are kept between calls. After add_minterms or
+    remove_minterms only the prime implicants through the changed minterms are regenerated, and only the
+    table rows and columns of changed minterms and prime implicants are touched. simplify starts the cover
+    search from the previous solution.
+
+    Prime implicants through a minterm are found by growing cubes around it one dash at a time, with
+    a memoized check of whether a cube lies in the on-set and don't cares (the care set). When minterms
+    are added, the old prime implicants that a new one contains stop being prime. When minterms are
+    removed, the prime implicants through them are dropped, and the ones that replace them lie inside
+    them, so they are regrown from the remaining minterms those covered."""
+    def __init__(self, n_vars, minterms=(), dont_cares=(), var_names=None, cover_solver=None):
+        bool_fn = BooleanFunction.from_minterms(n_vars, minterms, dont_cares, var_names)
+        self.arity = n_vars
+        self.var_names = bool_fn.ordered_unique_vars
+        self.cover_solver = BranchAndBoundCover() if cover_solver is None else cover_solver
+        self.on = set(bool_fn.minterms)
+        self.dont_cares = set(bool_fn.dont_cares)
+        self.cover = []
+        self.reset_table()
+        for minterm in sorted(self.on):
+            self.add_row(minterm)
+        for implicant in QM.combine_implicants(Implicant.from_minterm(minterm)
+                                               for minterm in self.on | self.dont_cares):
+            self.add_prime(implicant)
+
+    def reset_table(self):
+        """Start an empty table. Removed rows and columns keep their (cleared) slots in self.pit, whose
+        row and column of each minterm of the on-set and prime implicant are in row_lookup and col_lookup,
+        and live_rows and live_cols are the bitsets of the slots in use."""
+        self.pit = PrimeImplicantTable([], [], self.arity)
+        self.row_lookup = {}
+        self.col_lookup = {}
+        self.live_rows = 0
+        self.live_cols = 0
+
+    @property
+    def prime_implicants(self):
+        return set(self.col_lookup)
+
+    def add_minterms(self, minterms):
+        """Add minterms (which may have been don't cares) to the on-set."""
+        minterms = set(minterms) - self.on
+        check_terms(minterms, self.arity)
+        new_care = minterms - self.dont_cares
+        self.dont_cares -= minterms
+        self.on |= minterms
+        # a minterm that was a don't care is covered by the current prime implicants, so only its row is new.
+        for minterm in minterms:
+            self.add_row(minterm)
+        if new_care:
+            is_implicant = self.implicant_check()
+            new_primes = set()
+            for minterm in new_care:
+                new_primes.update(self.primes_through(minterm, is_implicant))
+            for implicant in self.prime_implicants:
+                if any(prime.contains(implicant) for prime in new_primes):
+                    self.remove_prime(implicant)
+            for implicant in new_primes:
+                if implicant not in self.col_lookup:
+                    self.add_prime(implicant)
+
+    def remove_minterms(self, minterms):
+        """Remove minterms (from the on-set or the don't cares), making the function 0 there."""
+        minterms = set(minterms) & (self.on | self.dont_cares)
+        for minterm in minterms & self.on:
+            self.remove_row(minterm)
+        self.on -= minterms
+        self.dont_cares -= minterms
+        if not minterms:
+            return
+        affected = set()
+        for implicant in self.prime_implicants:
+            if any(implicant.covers(minterm) for minterm in minterms):
+                self.remove_prime(implicant)
+                affected.update(implicant.minterms())
+        affected -= minterms
+        is_implicant = self.implicant_check()
+        for minterm in affected:
+            for implicant in self.primes_through(minterm, is_implicant):
+                if implicant not in self.col_lookup:
+                    self.add_prime(implicant)
+        if (len(self.pit.cols) > 2 * len(self.col_lookup) + 64 or
+                len(self.pit.rows) > 2 * len(self.row_lookup) + 64):
+            self.compact()
+
+    def implicant_check(self):
+        """Return a function telling whether the cube (value, mask) lies in the current care set.
+        value must be 0 in the positions of the dashes. Results of subcubes are memoized."""
+        care = self.on | self.dont_cares
+        memo = {}
+
+        def is_implicant(value, mask):
+            if mask == 0:
+                return value in care
+            key = (value, mask)
+            result = memo.get(key)
+            if result is None:
+                bit = mask & -mask
+                result = is_implicant(value, mask ^ bit) and is_implicant(value | bit, mask ^ bit)
+                memo[key] = result
+            return result
+        return is_implicant
+
+    def primes_through(self, minterm, is_implicant):
+        """Return the prime implicants of the care set that contain minterm."""
+        primes = set()
+        level = {0}
+        while level:
+            next_level = set()
+            for mask in level:
+                value = minterm & ~mask
+                grown = False
+                for i in range(self.arity):
+                    bit = 1 << i
+                    if not mask & bit and is_implicant(value & ~bit, mask | bit):
+                        next_level.add(mask | bit)
+                        grown = True
+                if not grown:
+                    primes.add(Implicant(value, mask))
+            level = next_level
+        return primes
+
+    def covered_rows(self, implicant):
+        """Return the bitset of the rows of the minterms of the on-set that implicant covers."""
+        col = 0
+        if 2 ** popcount(implicant.mask) < len(self.row_lookup):
+            for minterm in implicant.minterms():
+                row_index = self.row_lookup.get(minterm)
+                if row_index is not None:
+                    col |= 1 << row_index
+        else:
+            for minterm, row_index in self.row_lookup.items():
+                if implicant.covers(minterm):
+                    col |= 1 << row_index
+        return col
+
+    def add_row(self, minterm):
+        pit = self.pit
+        row_index = len(pit.rows)
+        row = 0
+        for implicant, col_index in self.col_lookup.items():
+            if implicant.covers(minterm):
+                row |= 1 << col_index
+                pit.cols[col_index] |= 1 << row_index
+        pit.all_minterms.append(minterm)
+        pit.rows.append(row)
+        self.row_lookup[minterm] = row_index
+        self.live_rows |= 1 << row_index
+
+    def remove_row(self, minterm):
+        pit = self.pit
+        row_index = self.row_lookup.pop(minterm)
+        for col_index in set_bits(pit.rows[row_index]):
+            pit.cols[col_index] &= ~(1 << row_index)
+        pit.rows[row_index] = 0
+        self.live_rows &= ~(1 << row_index)
+
+    def add_prime(self, implicant):
+        pit = self.pit
+        col_index = len(pit.cols)
+        col = self.covered_rows(implicant)
+        pit.all_prime_implicants.append(implicant)
+        pit.cols.append(col)
+        for row_index in set_bits(col):
+            pit.rows[row_index] |= 1 << col_index
+        self.col_lookup[implicant] = col_index
+        self.live_cols |= 1 << col_index
+
+    def remove_prime(self, implicant):
+        pit = self.pit
+        col_index = self.col_lookup.pop(implicant)
+        for row_index in set_bits(pit.cols[col_index]):
+            pit.rows[row_index] &= ~(1 << col_index)
+        pit.cols[col_index] = 0
+        self.live_cols &= ~(1 << col_index)
+
+    def compact(self):
+        """Renumber the rows and columns without the slots of removed minterms and prime implicants."""
+        minterms = sorted(self.row_lookup)
+        prime_implicants = sorted(self.col_lookup, key=self.col_lookup.get)
+        self.reset_table()
+        for minterm in minterms:
+            self.add_row(minterm)
+        for implicant in prime_implicants:
+            self.add_prime(implicant)
+
+    def table(self):
+        """Return the prime implicant table of the current on-set and prime implicants, with every live row
+        and column active again. It is the same object between calls, so it is only valid until the next
+        add_minterms or remove_minterms."""
+        self.pit.active_rows = self.live_rows
+        self.pit.active_cols = self.live_cols
+        self.pit.dominance_passes = []
+        return self.pit
+
+    def simplify(self, verbose=False):
+        """Return the simplified function as a sum of products, like QM.simplify."""
+        pit = self.table()
+        previous_cols = [self.col_lookup[implicant] for implicant in self.cover if implicant in self.col_lookup]
+        cover_solver = WarmStartCover(self.cover_solver, previous_cols)
+        chosen, self.cover_result = QM.cover_table(pit, verbose, cover_solver)
+        self.cover = sorted(chosen)
+        if not self.cover:
+            return "0"
+        bool_fn = BooleanFunction.from_minterms(self.arity, (), var_names=self.var_names)
+        return " + ".join(bool_fn.bitstring_as_product(implicant) for implicant in self.cover)
@@ -0,0 +1,43 @@
+import collections
+import contextlib
+import json
+import time
+
+
+class Stats:
+    """Structured timings and counters of the stages of a QM run.
+
+    Every measurement is an event: a dict with the name of the stage, the seconds it took and stage specific
+    counters, e.g. {"stage": "combine level", "seconds": 0.01, "level": 2, "implicants": 96, "primes": 4}.
+    Events are kept in order in self.events and, if a callback is given, passed to it as they happen."""
+
+    def __init__(self, callback=None):
+        self.events = []
+        self.callback = callback
+
+    def record(self, stage, seconds, **counters):
+        event = {"stage": stage, "seconds": seconds}
+        event.update(counters)
+        self.events.append(event)
+        if self.callback is not None:
+            self.callback(event)
+        return event
+
+    @contextlib.contextmanager
+    def timed(self, stage, **counters):
+        """Time the body of a with block as stage. The block may add counters to the dict it is given."""
+        counters = dict(counters)
+        start = time.perf_counter()
+        yield counters
+        self.record(stage, time.perf_counter() - start, **counters)
+
+    def stage_seconds(self):
+        """Return {stage: total seconds of its events}, in order of first appearance."""
+        totals = collections.OrderedDict()
+        for event in self.events:
+            totals[event["stage"]] = totals.get(event["stage"], 0) + event["seconds"]
+        return totals
+
+    def to_json(self):
+        """Return the events as JSON lines."""
+        return "\n".join(json.dumps(event) for event in self.events)
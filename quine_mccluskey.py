@@ -1,136 +1,496 @@
+import argparse
+import collections
+import concurrent.futures
 import itertools
+import os
+import sys
+import time
 
-from utils import BooleanFunction, Parser, PrimeImplicantTable
+from cover import BranchAndBoundCover, literal_count as col_literal_count
+from equivalence import check_equivalence
+from espresso import Espresso
+from profiling import Stats
+from truth_table import TruthTableFile
+from utils import BooleanFunction, Implicant, Node, Parser, PrimeImplicantTable, popcount, set_bits
 
 
 class QM:
-    def __init__(self, expr_string):
+    def __init__(self, expr_string, workers=1, backend="truth_table", stats=None, truth_table_path=None):
+        """workers is the number of processes used to generate the prime implicants.
+        backend is the BooleanFunction backend the minterms are drawn from ("truth_table", "bdd" or "file",
+        which writes the truth table to the file truth_table_path).
+        stats is the profiling.Stats that receives the timings and counters of each stage
+        (a new one by default); it is kept in self.stats."""
+        self._init(None, workers, stats, expr_string)
+        with self.stats.timed("parse", chars=len(expr_string)) as counters:
+            self.bool_fn = BooleanFunction(Parser(expr_string).syntax_tree, backend=backend,
+                                           truth_table_path=truth_table_path)
+            counters["vars"] = self.bool_fn.arity
+
+    def _init(self, bool_fn, workers, stats, expr_string=None):
+        """Set the attributes of a new QM. Every constructor goes through here."""
+        self.stats = Stats() if stats is None else stats
         self.expr_string = expr_string
-        self.bool_fn = BooleanFunction(Parser(expr_string).syntax_tree)
+        self.bool_fn = bool_fn
+        self.workers = workers
+        self._primes = None
+
+    @classmethod
+    def _from_bool_fn(cls, bool_fn, workers=1, stats=None):
+        quine_mccluskey = cls.__new__(cls)
+        quine_mccluskey._init(bool_fn, workers, stats)
+        return quine_mccluskey
+
+    @classmethod
+    def from_minterms(cls, n_vars, minterms, dont_cares=(), var_names=None, workers=1, stats=None):
+        """Make a QM directly from minterm indices, skipping the parser and the truth table sweep.
+        Don't cares take part in merging but do not need to be covered."""
+        return cls._from_bool_fn(BooleanFunction.from_minterms(n_vars, minterms, dont_cares, var_names), workers,
+                                 stats)
+
+    @classmethod
+    def from_truth_table_file(cls, path, arity=None, dont_cares=(), var_names=None, workers=1, stats=None):
+        """Make a QM from a packed truth table file (see truth_table.TruthTableFile), e.g. one exported from a
+        simulator. The file is memory-mapped and its minterms are streamed into the first merge level;
+        close the QM (or use it as a context manager) to unmap it."""
+        table_file = TruthTableFile(path, arity)
+        try:
+            bool_fn = BooleanFunction.from_truth_table_file(table_file, dont_cares, var_names)
+        except Exception:
+            table_file.close()
+            raise
+        return cls._from_bool_fn(bool_fn, workers, stats)
+
+    def close(self):
+        """Close the truth table file of the file backend (see BooleanFunction.close)."""
+        self.bool_fn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def prime_implicants(self):
-        return QM.combine_minterms(self.bool_fn.minterm_bitstrings)
+        return {implicant.bitstring(self.bool_fn.arity) for implicant in self._prime_implicants()}
+
+    def _prime_implicants(self):
+        """Return the prime implicants as Implicants. They are generated on the first call only."""
+        if self._primes is None:
+            if self.bool_fn.backend == "truth_table":
+                with self.stats.timed("minterms") as counters:
+                    counters["minterms"] = len(self.bool_fn.minterms)
+            elif self.bool_fn.backend == "file":
+                with self.stats.timed("truth table file") as counters:
+                    counters["bytes"] = len(self.bool_fn.table_file().buffer)
+            minterms = itertools.chain(self.bool_fn.iter_minterms(), self.bool_fn.dont_cares)
+            self._primes = QM.combine_implicants((Implicant.from_minterm(minterm) for minterm in minterms),
+                                                 self.workers, self.stats)
+        return self._primes
 
     @staticmethod
     def combine_minterms(minterms):
-        combined = set()
-        left_overs = set(minterms)
-        sorted_minterms = sorted(minterms,
-                                 key=lambda minterm: minterm.count("1"))
-        # group the minterms based on the number of 1s in their binary representation.
-        grouped_minterms = [list(group) for key, group in itertools.groupby(sorted_minterms,
-                                                                            key=lambda minterm: minterm.count("1"))]
-        for group, next_group in zip(grouped_minterms, grouped_minterms[1:]):
-            for minterm in group:
-                for next_minterm in next_group:
-                    if QM.differs_by_one_char(minterm, next_minterm):
-                        left_overs.discard(minterm)
-                        left_overs.discard(next_minterm)
-                        combined.add(QM.first_diff_replaced_with_dash(minterm, next_minterm))
-        if combined:
+        """Return the prime implicants of the given minterm bitstrings as bitstrings."""
+        minterms = list(minterms)
+        if not minterms:
+            return set()
+        arity = len(minterms[0])
+        return {implicant.bitstring(arity)
+                for implicant in QM.combine_implicants(Implicant.from_bitstring(minterm) for minterm in minterms)}
+
+    @staticmethod
+    def combine_implicants(implicants, workers=1, stats=None):
+        """Return the prime implicants that result from repeatedly merging the given implicants.
+        With workers > 1, the merging of large levels is split across that many worker processes
+        (see QM.merge_level_parallel). stats (a profiling.Stats) gets a "combine level" event per level."""
+        prime_implicants = set()
+        for level_prime_implicants in QM.prime_implicant_levels(implicants, workers, stats):
+            prime_implicants.update(level_prime_implicants)
+        return prime_implicants
+
+    @staticmethod
+    def prime_implicant_levels(implicants, workers=1, stats=None):
+        """Yield the prime implicants of each merge level in turn: those without dashes, then those
+        with one dash, and so on. Only the current level and the one merged from it are alive at a time,
+        so the memory used is bounded by the largest level rather than by all the levels."""
+        level = set(implicants)
+        executor = concurrent.futures.ProcessPoolExecutor(workers) if workers > 1 else None
+        try:
             # keep combining until there is nothing left to combine.
-            return left_overs.union(QM.combine_minterms(combined))
-        else:
-            return left_overs
+            n_level = 0
+            while level:
+                start = time.perf_counter()
+                n_implicants = len(level)
+                if executor is not None and len(level) >= QM.PARALLEL_MIN_LEVEL_SIZE:
+                    combined, level = QM.merge_level_parallel(level, executor, workers)
+                else:
+                    combined, merged = QM.merge_level(level)
+                    level -= merged
+                    del merged
+                if stats is not None:
+                    stats.record("combine level", time.perf_counter() - start, level=n_level,
+                                 implicants=n_implicants, primes=len(level), combined=len(combined))
+                n_level += 1
+                level_prime_implicants, level = level, combined
+                del combined
+                yield level_prime_implicants
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
-    def essential_prime_implicants(self, verbose):
-        essential_prime_implicants = set()
+    # Levels smaller than this are merged in the calling process, where they are faster than a round trip.
+    PARALLEL_MIN_LEVEL_SIZE = 4096
 
-        pit = PrimeImplicantTable(self.bool_fn.minterm_bitstrings, self.prime_implicants())
+    @staticmethod
+    def merge_level_parallel(implicants, executor, workers):
+        """QM.merge_level, split into tasks (see QM.parallel_tasks) for the executor's worker processes.
+        Returns (the merged implicants, the implicants that took part in no merge). The workers send back
+        plain values by mask, which are much cheaper to pickle than Implicants, and only the implicants that
+        are kept are made into Implicants here."""
+        combined = set()
+        merged = {}
+        for task_combined, task_merged in executor.map(QM.merge_parts, QM.parallel_tasks(implicants, workers)):
+            for mask, values in task_combined.items():
+                combined.update(Implicant(value, mask) for value in values)
+            for mask, values in task_merged.items():
+                merged.setdefault(mask, set()).update(values)
+        return combined, {implicant for implicant in implicants
+                          if implicant.value not in merged.get(implicant.mask, ())}
 
-        for i in range(10000):
-            try:
-                if verbose:
-                    print()
-                    print("iteration", i)
-                    print(pit)
-                new_essential_prime_implicants = QM.elim_essential_cols(pit)
-                dominating_row_removals = QM.elim_dominating_rows(pit)
-                dominated_col_removals = QM.elim_dominated_cols(pit)
-                if new_essential_prime_implicants.union(dominating_row_removals).union(dominated_col_removals):
-                    essential_prime_implicants.update(new_essential_prime_implicants)
-                else:
-                    # Arbitrary designate one of the prime implicants as essential.
-                    new_essential_prime_implicants.update(pit.prime_implicants[0])
-                    pit.remove_rows([0])
-                essential_prime_implicants.update(QM.elim_essential_cols(pit))
+    @staticmethod
+    def parallel_tasks(implicants, workers):
+        """Split a level into about 4 tasks per worker for QM.merge_parts, without sending any implicant
+        to more tasks than it can merge in.
+        Implicants only merge with implicants of the same mask, so each mask bucket is split on its own.
+        A bucket too large for one task is split into 2 ** t parts on its t highest free (non-dash) bits.
+        A part is responsible for the merges in which its value is the one with the 0 bit. Merges across the
+        other free bits stay inside the part. For merges across a split bit, the part is also sent the
+        values of the neighbouring part that are its partners (value | bit). So an implicant goes to its own
+        part, and to one more part for each split bit it is the partner across; no merge is done twice.
+        A task is a list of (mask, values, partner values) parts, with small buckets packed together."""
+        buckets = {}
+        for implicant in implicants:
+            buckets.setdefault(implicant.mask, []).append(implicant.value)
+        task_size = max(len(implicants) // (4 * workers), 1)
+        tasks = [[]]
+        task_load = 0
+        for mask, values in buckets.items():
+            for part in QM.split_bucket(mask, values, task_size):
+                if task_load >= task_size:
+                    tasks.append([])
+                    task_load = 0
+                tasks[-1].append(part)
+                task_load += len(part[1]) + len(part[2])
+        return tasks
+
+    @staticmethod
+    def split_bucket(mask, values, part_size):
+        """Yield the (mask, values, partner values) parts of a mask bucket (see QM.parallel_tasks)."""
+        n_parts = (len(values) + part_size - 1) // part_size
+        free_bits = [1 << i for i in reversed(range(max(values).bit_length())) if not mask >> i & 1]
+        split_bits = free_bits[:(n_parts - 1).bit_length()]
+        split_mask = sum(split_bits)
+        parts = {}
+        for value in values:
+            parts.setdefault(value & split_mask, []).append(value)
+        for key, part_values in parts.items():
+            own = set(part_values) if split_bits else ()
+            partners = [value for bit in split_bits if not key & bit
+                        for value in parts.get(key | bit, ()) if value ^ bit in own]
+            yield mask, part_values, partners
+
+    @staticmethod
+    def merge_parts(parts):
+        """Do the merges that the (mask, values, partner values) parts of a task are responsible for.
+        Returns ({mask: values} of the merged implicants, {mask: values} of the implicants that took part in
+        at least one merge), like QM.merge_level but without making Implicants."""
+        combined = {}
+        merged = {}
+        for mask, values, partners in parts:
+            lookup = set(values)
+            lookup.update(partners)
+            width = max(lookup).bit_length()
+            merged_values = merged.setdefault(mask, set())
+            for value in values:
+                for i in range(width):
+                    bit = 1 << i
+                    if (value | mask) & bit == 0 and value | bit in lookup:
+                        merged_values.add(value)
+                        merged_values.add(value | bit)
+                        combined.setdefault(mask | bit, set()).add(value)
+        return combined, merged
+
+    @staticmethod
+    def merge_level(implicants):
+        """Merge every pair of implicants that differ in exactly one non-dash position.
+        Returns (the merged implicants, the implicants that took part in at least one merge).
+        Implicants are bucketed by mask so only implicants with the same dashes are considered,
+        and the merge partner of value across bit i is found by looking up value | (1 << i)."""
+        buckets = {}
+        for implicant in implicants:
+            buckets.setdefault(implicant.mask, set()).add(implicant.value)
+        combined = set()
+        merged = set()
+        for mask, values in buckets.items():
+            width = max(values).bit_length()
+            for value in values:
+                for i in range(width):
+                    bit = 1 << i
+                    if (value | mask) & bit == 0 and value | bit in values:
+                        merged.add(Implicant(value, mask))
+                        merged.add(Implicant(value | bit, mask))
+                        combined.add(Implicant(value, mask | bit))
+        return combined, merged
+
+    def essential_prime_implicants(self, verbose, cover_solver=None):
+        """Return the prime implicants of a minimal cover (see QM.cover_table).
+        The cover solver's result is kept in self.cover_result."""
+        prime_implicants = self._prime_implicants()
+        with self.stats.timed("table") as counters:
+            pit = PrimeImplicantTable(self.bool_fn.iter_minterms(), prime_implicants, self.bool_fn.arity)
+            counters["rows"], counters["cols"] = pit.n_rows, pit.n_cols
+        essential_prime_implicants, self.cover_result = QM.cover_table(pit, verbose, cover_solver, self.stats)
+        self.dominance_passes = pit.dominance_passes
+        return essential_prime_implicants
+
+    @staticmethod
+    def cover_table(pit, verbose=False, cover_solver=None, stats=None):
+        """Return (the prime implicants of a minimal cover of the table, the cover solver's result or None).
+        Essential columns, dominating rows and dominated columns are eliminated until none are left,
+        then the remaining cyclic core is handed to cover_solver (BranchAndBoundCover by default).
+        stats (a profiling.Stats) gets an event per reduction pass and one for the cyclic core."""
+        if cover_solver is None:
+            cover_solver = BranchAndBoundCover()
+        essential_prime_implicants = set()
+        cover_result = None
+        iteration = 0
+        while pit.n_rows and pit.n_cols:
+            if verbose:
+                print()
+                print("iteration", iteration)
+                print(pit)
+            start = time.perf_counter()
+            new_essential_prime_implicants = QM.elim_essential_cols(pit)
+            essential_seconds = time.perf_counter() - start
+            n_passes = len(pit.dominance_passes)
+            dominating_row_removals = QM.elim_dominating_rows(pit)
+            dominated_col_removals = QM.elim_dominated_cols(pit)
+            essential_prime_implicants.update(new_essential_prime_implicants)
+            if stats is not None:
+                stats.record("essential cols", essential_seconds, iteration=iteration,
+                             removals=len(new_essential_prime_implicants))
+                for name, comparisons, removals, seconds in pit.dominance_passes[n_passes:]:
+                    stats.record(name, seconds, iteration=iteration, comparisons=comparisons, removals=removals)
+            if verbose:
+                print("essential prime implicants:",
+                      {implicant.bitstring(pit.arity) for implicant in essential_prime_implicants})
+                print("dominating row removals:", dominating_row_removals)
+                print("dominated col removals:", dominated_col_removals)
+            if not (new_essential_prime_implicants or dominating_row_removals or dominated_col_removals):
+                # No reduction applies, so the rest of the table is a cyclic core.
+                start = time.perf_counter()
+                n_rows, n_cols = pit.n_rows, pit.n_cols
+                cover_result = cover_solver.solve(pit)
+                if stats is not None:
+                    stats.record("cyclic core", time.perf_counter() - start, rows=n_rows, cols=n_cols,
+                                 cost=cover_result.cost, optimal=cover_result.optimal, nodes=cover_result.nodes)
+                essential_prime_implicants.update(pit.all_prime_implicants[col_index]
+                                                  for col_index in cover_result.cols)
                 if verbose:
-                    print("essential prime implicants:", essential_prime_implicants)
-                    print("dominating row removals:", QM.elim_dominating_rows(pit))
-                    print("dominated col removals:", QM.elim_dominated_cols(pit))
-                if pit.n_rows == 0 or pit.n_cols == 0:
-                    break
-            except IndexError:  # Because the prime implicant table is empty.
+                    print("cyclic core cover:", cover_result)
                 break
-        return essential_prime_implicants
+            iteration += 1
+        return essential_prime_implicants, cover_result
 
-    def simplify(self, verbose=False):
-        if verbose:
+    def simplify(self, verbose=False, cover_solver=None, mode="exact", cache=None, verify=False, form="sop"):
+        """Return the simplified function as a sum of products.
+        mode="exact" enumerates the prime implicants and finds a minimal cover of them.
+        mode="heuristic" runs Espresso on cube covers instead, which avoids the truth table and the full
+        list of prime implicants, so it works for functions with too many variables for the exact mode.
+        cache may be a SimplifyCache, which is checked before (and filled after) simplifying.
+        With verify=True the result is checked against the input function (see check_equivalence), and a
+        ValueError is raised if they differ. The Equivalence is kept in self.verification.
+        form="pos" returns a product of sums instead, found by minimizing the complement (see QM.complement),
+        and form="best" returns whichever of the two has fewer literals, preferring the sum of products on a tie.
+        In the exact mode with workers > 1, form="best" minimizes the complement in a worker process meanwhile.
+        The form returned is kept in self.form."""
+        if mode not in ("exact", "heuristic"):
+            raise ValueError("Invalid mode: " + str(mode))
+        if form not in ("sop", "pos", "best"):
+            raise ValueError("Invalid form: " + str(form))
+        with self.stats.timed("simplify", mode=mode, form=form):
+            return self._simplify(verbose, cover_solver, mode, cache, verify, form)
+
+    def _simplify(self, verbose, cover_solver, mode, cache, verify, form):
+        if verbose and mode == "exact":
             print("minterms:", self.bool_fn.minterm_bitstrings)
             print("prime implicants:", self.prime_implicants())
-        if self.bool_fn.arity > 0:
-            essential_prime_implicants = self.essential_prime_implicants(verbose)
-            if essential_prime_implicants:
-                return " + ".join(
-                    self.bool_fn.bitstring_as_product(implicant) for implicant in essential_prime_implicants)
-            return "0"
-        return self.bool_fn.evaluate(var_values="")
+        if self.bool_fn.arity == 0:
+            self.form = "sop"
+            return self.bool_fn.evaluate(var_values="")
+        implicants = complement_implicants = None
+        if form != "sop":
+            complement = self.complement(mode)
+            if form == "best" and mode == "exact" and self.workers > 1:
+                with concurrent.futures.ProcessPoolExecutor(1) as executor:
+                    future = executor.submit(_complement_implicants, complement.bool_fn.arity,
+                                             complement.bool_fn.minterms, complement.bool_fn.dont_cares, cover_solver)
+                    implicants = self.implicants(verbose, cover_solver, mode, cache)
+                    complement_implicants = future.result()
+            else:
+                complement_implicants = complement.implicants(verbose, cover_solver, mode, cache)
+        if form != "pos" and implicants is None:
+            implicants = self.implicants(verbose, cover_solver, mode, cache)
+        if form == "best":
+            form = "pos" if literal_count(complement_implicants, self.bool_fn.arity) < \
+                literal_count(implicants, self.bool_fn.arity) else "sop"
+        self.form = form
+        if form == "pos":
+            if verify:
+                self.verify(complement_implicants, complemented=True)
+            if complement_implicants:
+                return ".".join(QM.parenthesized(self.bool_fn.bitstring_as_sum(implicant))
+                                for implicant in complement_implicants)
+            return "1"
+        if verify:
+            self.verify(implicants)
+        if implicants:
+            return " + ".join(self.bool_fn.bitstring_as_product(implicant) for implicant in implicants)
+        return "0"
+
+    @staticmethod
+    def parenthesized(term):
+        return "(" + term + ")" if " + " in term else term
+
+    def implicants(self, verbose=False, cover_solver=None, mode="exact", cache=None):
+        """Return the implicants of the sum of products that simplify returns, going through cache if given."""
+        if cache is not None:
+            key = cache.fingerprint(self.bool_fn, mode, cover_solver)
+            implicants = cache.get(key)
+            if implicants is not None:
+                return implicants
+        if mode == "heuristic":
+            with self.stats.timed("heuristic") as counters:
+                implicants = self.heuristic_implicants()
+                counters["products"] = len(implicants)
+        else:
+            implicants = self.essential_prime_implicants(verbose, cover_solver)
+        if cache is not None:
+            cache.put(key, implicants)
+        return implicants
+
+    def complement(self, mode="exact"):
+        """Return a QM of the complement of the function, sharing this one's stats. It is made from the maxterms,
+        which come from the same truth table sweep as the minterms, except in the heuristic mode, where it is
+        the negation of the syntax tree so that Espresso still avoids the truth table."""
+        var_names = self.bool_fn.ordered_unique_vars
+        if mode == "heuristic" and self.bool_fn.tree is not None:
+            return QM._from_bool_fn(BooleanFunction(Node("~", self.bool_fn.tree), var_names), self.workers,
+                                    self.stats)
+        return QM.from_minterms(self.bool_fn.arity, self.bool_fn.maxterms, self.bool_fn.dont_cares, var_names,
+                               self.workers, self.stats)
+
+    def verify(self, implicants, complemented=False):
+        """Check that the sum of implicants is the function being simplified, up to its don't cares.
+        With complemented=True it is the complement of the sum that is checked, as for a product of sums."""
+        with self.stats.timed("verify") as counters:
+            simplified = BooleanFunction.from_implicants(implicants, self.bool_fn.ordered_unique_vars)
+            if complemented:
+                simplified = BooleanFunction(Node("~", simplified.tree), self.bool_fn.ordered_unique_vars)
+            self.verification = check_equivalence(self.bool_fn, simplified, self.bool_fn.dont_cares)
+            counters["equivalent"] = self.verification.equivalent
+        if not self.verification:
+            raise ValueError("Simplified function differs from the input at " +
+                             str(self.verification.counterexample))
+
+    def heuristic_implicants(self):
+        """Return a cover of prime implicants found by Espresso, which is small but not necessarily minimal."""
+        if self.bool_fn.tree is None:
+            espresso = Espresso(self.bool_fn.arity,
+                                [Implicant.from_minterm(minterm) for minterm in self.bool_fn.iter_minterms()],
+                                [Implicant.from_minterm(minterm) for minterm in self.bool_fn.dont_cares])
+        else:
+            espresso = Espresso.from_tree(self.bool_fn.tree, self.bool_fn.ordered_unique_vars)
+        return espresso.minimize()
 
     @staticmethod
     def elim_essential_cols(pit):
         """Remove and return the essential columns.
         (i.e. the prime implicants that cover minterms no other prime implicant covers."""
-        essential_pis = set()
-        row_removals = set()
-        col_removals = set()
-        for row_index in range(pit.n_rows):
-            row = pit.row(row_index)
-            if row.count(True) == 1:
-                col_index = row.index(True)
-                essential_pis.add(pit.prime_implicants[col_index])
-                col_removals.add(col_index)
-        for row_index in range(pit.n_rows):
-            row = pit.row(row_index)
-            for col_index in col_removals:
-                if row[col_index]:
-                    row_removals.add(row_index)
-                    break
-        pit.remove_rows(row_removals)
-        pit.remove_cols(col_removals)
-        return essential_pis
+        essential_cols = 0
+        for row_index in pit.row_indices():
+            row = pit.row_bits(row_index)
+            if row and row & (row - 1) == 0:
+                essential_cols |= row
+        row_removals = 0
+        for col_index in set_bits(essential_cols):
+            row_removals |= pit.col_bits(col_index)
+        pit.remove_rows(set_bits(row_removals))
+        pit.remove_cols(set_bits(essential_cols))
+        return {pit.all_prime_implicants[col_index] for col_index in set_bits(essential_cols)}
 
     @staticmethod
     def elim_dominating_rows(pit):
         """Remove the dominating rows.
-        (i.e. the minterms that are covered by more prime implicants than necessary."""
+        (i.e. the minterms that are covered by more prime implicants than necessary.
+        Rows are visited in increasing order of their bitsets as ints, and a subset of a row is never a larger
+        int, so a row can only dominate rows that were already kept. A row is only compared against the kept
+        rows whose lowest set bit is one of its bits."""
+        start = time.perf_counter()
+        comparisons = 0
         row_removals = set()
-        for row_index in range(pit.n_rows):
-            for other_row_index in range(row_index + 1, pit.n_rows):
-                dominance_rel = QM.order_by_dominance(pit.row(row_index), pit.row(other_row_index))
-                if dominance_rel is not None:
-                    dominating_row, dominated_row = dominance_rel
-                    if dominating_row == pit.row(row_index):
-                        row_removals.add(row_index)
-                    else:
-                        row_removals.add(other_row_index)
+        kept_by_lowest_bit = {}
+        for row, row_index in sorted((pit.row_bits(row_index), row_index) for row_index in pit.row_indices()):
+            remaining = row
+            dominating = False
+            while remaining and not dominating:
+                lowest_bit = remaining & -remaining
+                for kept_row in kept_by_lowest_bit.get(lowest_bit, ()):
+                    comparisons += 1
+                    if kept_row & ~row == 0:
+                        dominating = True
+                        break
+                remaining ^= lowest_bit
+            if dominating:
+                row_removals.add(row_index)
+            elif row:
+                kept_by_lowest_bit.setdefault(row & -row, []).append(row)
         pit.remove_rows(row_removals)
+        pit.log_pass("dominating rows", comparisons, len(row_removals), time.perf_counter() - start)
         return row_removals
 
     @staticmethod
     def elim_dominated_cols(pit):
         """Remove the dominated columns.
-        (i.e. the prime implicants that are already covered by a more general prime implicant."""
+        (i.e. the prime implicants whose rows are all covered by another prime implicant with at most as many
+        literals, so removing them can not make the cover cost more products or literals.
+        Columns are visited in order of decreasing popcount, and among columns of the same popcount, of
+        increasing literal count, so of identical columns the cheapest one is kept. A column is only compared
+        against the kept columns that cover its first row, which are read off that row's bitset."""
+        start = time.perf_counter()
+        comparisons = 0
         col_removals = set()
-        for col_index in range(pit.n_cols):
-            for other_col_index in range(col_index + 1, pit.n_cols):
-                dominance_rel = QM.order_by_dominance(pit.col(col_index), pit.col(other_col_index))
-                if dominance_rel is not None:
-                    dominating_col, dominated_col = dominance_rel
-                    if dominated_col == pit.col(col_index):
-                        col_removals.add(col_index)
-                    else:
-                        col_removals.add(other_col_index)
+        kept_cols = 0
+        literals = {col_index: col_literal_count(pit, col_index) for col_index in pit.col_indices()}
+        for col_index in sorted(pit.col_indices(),
+                                key=lambda col_index: (-popcount(pit.col_bits(col_index)), literals[col_index])):
+            col = pit.col_bits(col_index)
+            if col:
+                candidates = pit.row_bits((col & -col).bit_length() - 1) & kept_cols
+                dominated = False
+                for other_col_index in set_bits(candidates):
+                    comparisons += 1
+                    if col & ~pit.col_bits(other_col_index) == 0 and literals[other_col_index] <= literals[col_index]:
+                        dominated = True
+                        break
+            else:
+                dominated = kept_cols != 0
+            if dominated:
+                col_removals.add(col_index)
+            else:
+                kept_cols |= 1 << col_index
         pit.remove_cols(col_removals)
+        pit.log_pass("dominated cols", comparisons, len(col_removals), time.perf_counter() - start)
         return col_removals
 
     @staticmethod
@@ -166,11 +526,235 @@ class QM:
             return y, x
 
 
-def main():
-#    quine_mccluskey = QM("~(~(A.~(A.B)).~(B.~(A.B)))")
-    quine_mccluskey = QM("~(~(A+B).~(B+C))")
-    print(quine_mccluskey.simplify(verbose=True))
+class MultiOutputQM:
+    """Simplify several functions of a common set of variables together, so that products can be
+    shared between them. Each expression is parsed and its truth table swept once, the prime
+    implicants of all the outputs are generated together (each tagged with the set of outputs it
+    is an implicant of), and a single covering problem is solved over all (output, minterm) pairs,
+    where using a product costs the same no matter how many outputs share it."""
+    def __init__(self, expr_strings):
+        self.expr_strings = list(expr_strings)
+        trees = [Parser(expr_string).syntax_tree for expr_string in self.expr_strings]
+        var_names = sorted(set().union(*(BooleanFunction(tree).ordered_unique_vars for tree in trees)))
+        self.bool_fns = [BooleanFunction(tree, var_names) for tree in trees]
+        self.arity = len(var_names)
+
+    def tagged_prime_implicants(self):
+        """Return a dict mapping each multi-output prime implicant to its tag, the bitset of the outputs
+        that it is an implicant of."""
+        tagged = {}
+        for output, bool_fn in enumerate(self.bool_fns):
+            for minterm in bool_fn.minterms:
+                implicant = Implicant.from_minterm(minterm)
+                tagged[implicant] = tagged.get(implicant, 0) | 1 << output
+        return MultiOutputQM.combine_tagged_implicants(tagged)
+
+    @staticmethod
+    def combine_tagged_implicants(tagged):
+        """Like QM.combine_implicants, for implicants tagged with a bitset of outputs. Two implicants merge
+        into one tagged with the outputs they share, and an implicant is only discarded if a merge
+        keeps all of its outputs."""
+        prime_implicants = {}
+        level = dict(tagged)
+        while level:
+            buckets = {}
+            for implicant, tag in level.items():
+                buckets.setdefault(implicant.mask, {})[implicant.value] = tag
+            combined = {}
+            merged = set()
+            for mask, tags in buckets.items():
+                width = max(tags).bit_length()
+                for value, tag in tags.items():
+                    for i in range(width):
+                        bit = 1 << i
+                        if (value | mask) & bit == 0 and value | bit in tags:
+                            other_tag = tags[value | bit]
+                            shared_tag = tag & other_tag
+                            if shared_tag:
+                                implicant = Implicant(value, mask | bit)
+                                combined[implicant] = combined.get(implicant, 0) | shared_tag
+                                if shared_tag == tag:
+                                    merged.add(Implicant(value, mask))
+                                if shared_tag == other_tag:
+                                    merged.add(Implicant(value | bit, mask))
+            for implicant, tag in level.items():
+                if implicant not in merged:
+                    prime_implicants[implicant] = tag
+            level = combined
+        return prime_implicants
+
+    def shared_cover(self, verbose=False, cover_solver=None):
+        """Return a list with, for each output, the set of products it uses.
+        The rows of the table are (output, minterm) pairs and the columns are the tagged prime implicants."""
+        tagged = self.tagged_prime_implicants()
+        prime_implicants = list(tagged)
+        row_labels = [(output, minterm) for output, bool_fn in enumerate(self.bool_fns)
+                      for minterm in bool_fn.minterms]
+        row_lookup = {row_label: row_index for row_index, row_label in enumerate(row_labels)}
+        rows = [0] * len(row_labels)
+        for col_index, implicant in enumerate(prime_implicants):
+            # every minterm of a tagged implicant is a minterm of each of its outputs.
+            for minterm in implicant.minterms():
+                for output in set_bits(tagged[implicant]):
+                    rows[row_lookup[(output, minterm)]] |= 1 << col_index
+        pit = PrimeImplicantTable.from_rows(row_labels, prime_implicants, rows, self.arity)
+        chosen, self.cover_result = QM.cover_table(pit, verbose, cover_solver)
+        self.dominance_passes = pit.dominance_passes
+        products = []
+        for output, bool_fn in enumerate(self.bool_fns):
+            candidates = [implicant for implicant in chosen if tagged[implicant] >> output & 1]
+            products.append(MultiOutputQM.irredundant(candidates, bool_fn.minterms))
+        return products
+
+    @staticmethod
+    def irredundant(implicants, minterms):
+        """Return the implicants, without those whose minterms are all covered by the other implicants.
+        The implicants with the most literals are dropped first."""
+        kept = sorted(implicants, key=lambda implicant: popcount(implicant.mask))
+        for implicant in list(kept):
+            others = [other for other in kept if other != implicant]
+            if all(any(other.covers(minterm) for other in others)
+                   for minterm in minterms if implicant.covers(minterm)):
+                kept.remove(implicant)
+        return set(kept)
+
+    def simplify(self, verbose=False, cover_solver=None):
+        """Return a list with the simplified sum of products of each output."""
+        if self.arity == 0:
+            return [bool_fn.evaluate(var_values="") for bool_fn in self.bool_fns]
+        results = []
+        for bool_fn, products in zip(self.bool_fns, self.shared_cover(verbose, cover_solver)):
+            if products:
+                results.append(" + ".join(bool_fn.bitstring_as_product(implicant) for implicant in products))
+            else:
+                results.append("0")
+        return results
+
+
+def literal_count(implicants, arity):
+    """Return the number of literals in the sum of products (or product of sums) of implicants."""
+    return sum(arity - popcount(implicant.mask) for implicant in implicants)
+
+
+def _complement_implicants(arity, minterms, dont_cares, cover_solver):
+    return QM.from_minterms(arity, minterms, dont_cares).essential_prime_implicants(False, cover_solver)
+
+
+# The outcome of simplifying one expression in a batch. Exactly one of result and error is None.
+BatchResult = collections.namedtuple("BatchResult", ["expr_string", "result", "error"])
+
+
+def simplify_safely(expr_string, **simplify_kwargs):
+    """Return a BatchResult for QM(expr_string).simplify(**simplify_kwargs), capturing any exception
+    (e.g. the ValueError of an invalid expression) instead of raising it."""
+    try:
+        return BatchResult(expr_string, QM(expr_string).simplify(**simplify_kwargs), None)
+    except Exception as error:
+        return BatchResult(expr_string, None, "{}: {}".format(type(error).__name__, error))
+
+
+def simplify_truth_table_safely(path, **simplify_kwargs):
+    """Return a BatchResult for the truth table file at path like simplify_safely, closing the file afterwards."""
+    try:
+        with QM.from_truth_table_file(path) as quine_mccluskey:
+            return BatchResult(path, quine_mccluskey.simplify(**simplify_kwargs), None)
+    except Exception as error:
+        return BatchResult(path, None, "{}: {}".format(type(error).__name__, error))
+
+
+def _simplify_chunk(expr_strings, simplify_kwargs):
+    return [simplify_safely(expr_string, **simplify_kwargs) for expr_string in expr_strings]
+
+
+def simplify_many(expr_strings, workers=None, chunksize=16, **simplify_kwargs):
+    """Simplify many expressions over a pool of worker processes, yielding a BatchResult for each
+    expression in input order as soon as it (and everything before it) is done.
+    expr_strings may be any iterable (e.g. a file); it is read in chunks of chunksize expressions,
+    with at most 2 chunks per worker in flight. workers defaults to the number of CPUs;
+    workers=1 simplifies in the calling process without a pool."""
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1, got " + str(chunksize))
+    expr_strings = iter(expr_strings)
+    chunks = iter(lambda: list(itertools.islice(expr_strings, chunksize)), [])
+    if workers == 1:
+        for chunk in chunks:
+            for result in _simplify_chunk(chunk, simplify_kwargs):
+                yield result
+        return
+    if workers is None:
+        workers = os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        max_in_flight = 2 * workers
+        in_flight = collections.deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(_simplify_chunk, chunk, simplify_kwargs))
+            if len(in_flight) >= max_in_flight:
+                for result in in_flight.popleft().result():
+                    yield result
+        while in_flight:
+            for result in in_flight.popleft().result():
+                yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simplify boolean expressions with the Quine-McCluskey method. "
+                                                 "Prints one tab separated line of expression and result "
+                                                 "(or error) per expression.")
+    parser.add_argument("file", nargs="?", default="-",
+                        help="file with one expression per line (default: stdin)")
+    parser.add_argument("-e", "--expr", action="append", help="an expression to simplify (may be repeated)")
+    parser.add_argument("-w", "--workers", type=positive_int, default=None,
+                        help="number of worker processes (default: number of CPUs, 1: no pool)")
+    parser.add_argument("-c", "--chunksize", type=positive_int, default=16,
+                        help="expressions sent to a worker at a time")
+    parser.add_argument("-m", "--mode", choices=["exact", "heuristic"], default="exact")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print the steps of the simplification")
+    parser.add_argument("--verify", action="store_true", help="check every result against its expression")
+    parser.add_argument("-t", "--truth-table", action="append",
+                        help="a packed truth table file to simplify instead of expressions (may be repeated)")
+    args = parser.parse_args(argv)
+
+    if args.truth_table is not None:
+        return print_results(simplify_truth_table_safely(path, verbose=args.verbose, mode=args.mode,
+                                                         verify=args.verify)
+                             for path in args.truth_table)
+
+    if args.verbose:
+        # verbose output can not be interleaved across processes.
+        args.workers = 1
+
+    def simplify_all(expr_strings):
+        return print_results(simplify_many(expr_strings, args.workers, args.chunksize,
+                                           mode=args.mode, verbose=args.verbose, verify=args.verify))
+
+    if args.expr is not None:
+        return simplify_all(args.expr)
+    if args.file == "-":
+        return simplify_all(line.strip() for line in sys.stdin if line.strip())
+    with open(args.file) as lines:
+        return simplify_all(line.strip() for line in lines if line.strip())
+
+
+def positive_int(string):
+    value = int(string)
+    if value < 1:
+        raise argparse.ArgumentTypeError("expected a positive integer, got " + string)
+    return value
+
+
+def print_results(results):
+    """Print a tab separated line of expression and result (or error) per BatchResult, and return the exit
+    status: 1 if any of them is an error."""
+    n_errors = 0
+    for expr_string, result, error in results:
+        if error is None:
+            print(expr_string, result, sep="\t")
+        else:
+            n_errors += 1
+            print(expr_string, "error: " + error, sep="\t")
+        sys.stdout.flush()
+    return 1 if n_errors else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
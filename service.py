@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+from quine_mccluskey import BatchResult, simplify_safely
+from utils import Parser
+
+# The QM.simplify arguments a request may set.
+SIMPLIFY_OPTIONS = ("mode", "form", "verify")
+
+
+class SimplifyService:
+    """An asyncio front end to QM.simplify, which runs the simplifications in a pool of worker processes so
+    the event loop is never blocked by one.
+
+    Requests wait in a queue of at most max_queue entries, from which workers jobs at a time are handed to the
+    pool; when the queue is full, simplify waits for room before returning, which pushes back on the callers.
+    Concurrent requests for the same function are coalesced: they share the job of the first one and the
+    later ones are never queued. Two requests are the same function when their syntax trees have the same
+    Node.canonical_key and their options are the same, so reordered operands coalesce too. The key is linear
+    in the size of the expression: nothing exponential in its variables, like the truth table, is computed
+    on the event loop.
+
+    Use it as an async context manager, or call start and close."""
+    # Latency percentiles are taken over this many of the latest requests.
+    LATENCY_WINDOW = 1024
+
+    def __init__(self, workers=None, max_queue=64, executor=None, stats=None):
+        """workers is the number of jobs handed to the executor at a time (default: the number of CPUs).
+        executor defaults to a ProcessPoolExecutor of workers processes, which close shuts down.
+        stats (a profiling.Stats) gets a "request" event per request."""
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if executor is None:
+            executor = concurrent.futures.ProcessPoolExecutor(workers)
+            self.owns_executor = True
+        else:
+            self.owns_executor = False
+        self.executor = executor
+        self.workers = workers
+        self.max_queue = max_queue
+        self.stats = stats
+        self.queue = None
+        self.tasks = []
+        self.in_flight = {}
+        self.latencies = collections.deque(maxlen=SimplifyService.LATENCY_WINDOW)
+        self.counts = collections.Counter()
+        self.max_queue_depth = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue(self.max_queue)
+        # start the worker processes before any connection is accepted: a process forked while a connection is
+        # open keeps its socket open, so the client would never see the end of the response.
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, int) for _ in range(self.workers)))
+        self.tasks = [asyncio.ensure_future(self.work()) for _ in range(self.workers)]
+        return self
+
+    async def close(self):
+        """Stop the workers and cancel the jobs still queued or running, so that their callers are not left
+        waiting."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        # a caller still waiting for room in the queue has its job in in_flight too.
+        for future in self.in_flight.values():
+            future.cancel()
+        self.in_flight.clear()
+        while self.queue is not None and not self.queue.empty():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.queue.task_done()
+            # the callers that were given room by the gets put their (cancelled) jobs in now.
+            await asyncio.sleep(0)
+        if self.owns_executor:
+            self.executor.shutdown()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @staticmethod
+    def key(expr_string, options):
+        """Return the coalescing key of a request. Raises ValueError for an invalid expression."""
+        return Parser(expr_string).syntax_tree.canonical_key(), tuple(sorted(options.items()))
+
+    async def simplify(self, expr_string, **options):
+        """Return the BatchResult of QM(expr_string).simplify(**options), with any error captured in it.
+        options may be any of SIMPLIFY_OPTIONS."""
+        start = time.perf_counter()
+        self.counts["requests"] += 1
+        try:
+            for option, value in options.items():
+                if option not in SIMPLIFY_OPTIONS:
+                    raise ValueError("Invalid option: " + str(option))
+                try:
+                    hash(value)
+                except TypeError:
+                    raise ValueError("Invalid value for option {}: {!r}".format(option, value))
+            key = SimplifyService.key(expr_string, options)
+        except Exception as error:
+            result = BatchResult(expr_string, None, "{}: {}".format(type(error).__name__, error))
+            self.finish(result, start, coalesced=False)
+            return result
+        future = self.in_flight.get(key)
+        coalesced = future is not None
+        if coalesced:
+            self.counts["coalesced"] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self.in_flight[key] = future
+            try:
+                await self.queue.put((key, expr_string, options, future))
+            except BaseException:
+                del self.in_flight[key]
+                future.cancel()
+                raise
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        # a cancelled caller must not cancel the job that coalesced callers are waiting on too.
+        result = (await asyncio.shield(future))._replace(expr_string=expr_string)
+        self.finish(result, start, coalesced)
+        return result
+
+    def finish(self, result, start, coalesced):
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        self.counts["completed"] += 1
+        if result.error is not None:
+            self.counts["errors"] += 1
+        if self.stats is not None:
+            self.stats.record("request", latency, queue_depth=self.queue.qsize(), coalesced=coalesced,
+                              error=result.error is not None)
+
+    async def work(self):
+        """Hand queued jobs to the executor one at a time, until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            key, expr_string, options, future = await self.queue.get()
+            try:
+                result = await loop.run_in_executor(self.executor, _simplify_job, expr_string, options)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as error:
+                future.set_exception(error)
+                # every caller waiting on it may have been cancelled, in which case nobody retrieves the error.
+                future.exception()
+            else:
+                future.set_result(result)
+            finally:
+                del self.in_flight[key]
+                self.queue.task_done()
+
+    def metrics(self):
+        """Return the counters of the service, its current and largest queue depth, the number of distinct
+        jobs in flight, and the mean and percentiles (in seconds) of the latency of the latest requests."""
+        latencies = sorted(self.latencies)
+        metrics = {"requests": self.counts["requests"], "coalesced": self.counts["coalesced"],
+                   "completed": self.counts["completed"], "errors": self.counts["errors"],
+                   "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+                   "max_queue_depth": self.max_queue_depth, "in_flight": len(self.in_flight)}
+        if latencies:
+            metrics["latency_mean"] = sum(latencies) / len(latencies)
+            for name, fraction in (("latency_p50", 0.5), ("latency_p95", 0.95), ("latency_max", 1)):
+                metrics[name] = latencies[min(int(fraction * len(latencies)), len(latencies) - 1)]
+        return metrics
+
+    async def handle(self, reader, writer):
+        """Serve one HTTP/1.0 request: POST /simplify with a JSON object holding "expr" and any of
+        SIMPLIFY_OPTIONS, or GET /metrics."""
+        try:
+            method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+            headers = {}
+            line = await reader.readline()
+            while line.strip():
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+                line = await reader.readline()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            status, payload = await self.route(method, target, body)
+        except (ValueError, KeyError, TypeError, asyncio.IncompleteReadError) as error:
+            status, payload = 400, {"error": "{}: {}".format(type(error).__name__, error)}
+        except Exception as error:
+            # e.g. a broken process pool.
+            status, payload = 500, {"error": "{}: {}".format(type(error).__name__, error)}
+        content = json.dumps(payload).encode()
+        writer.write("HTTP/1.0 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n".format(
+            status, HTTP_REASONS[status], len(content)).encode("latin-1") + content)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def route(self, method, target, body):
+        if (method, target) == ("GET", "/metrics"):
+            return 200, self.metrics()
+        if (method, target) == ("POST", "/simplify"):
+            request = json.loads(body.decode())
+            options = {option: request[option] for option in SIMPLIFY_OPTIONS if option in request}
+            return 200, (await self.simplify(request["expr"], **options))._asdict()
+        return 404, {"error": "Not found: {} {}".format(method, target)}
+
+    async def serve(self, host="127.0.0.1", port=8000, path=None):
+        """Return a started asyncio server of handle, on a Unix socket if path is given, else on host and port."""
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path)
+        return await asyncio.start_server(self.handle, host, port)
+
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+
+def _simplify_job(expr_string, options):
+    return simplify_safely(expr_string, **options)
+
+
+async def _serve_forever(args):
+    async with SimplifyService(args.workers, args.max_queue) as service:
+        server = await service.serve(args.host, args.port, args.unix)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve QM.simplify over HTTP: POST /simplify with a JSON object "
+                                                 "like {\"expr\": \"A.B+A.~B\", \"form\": \"best\"}, "
+                                                 "GET /metrics for the queue and latency metrics.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=8000)
+    parser.add_argument("-u", "--unix", help="serve on this Unix socket path instead of host and port")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("-q", "--max-queue", type=int, default=64, help="requests that may wait for a worker")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve_forever(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,29 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import gc
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 from unittest import TestCase
 
 from quine_mccluskey import *
 from utils import *
 from utils import PrimeImplicantTable
+from cover import *
+from espresso import Espresso
+from cache import SimplifyCache
+from dag import NodeStore
+from bdd import BDD
+from profiling import Stats
+from equivalence import Equivalence, check_equivalence, equivalent
+from incremental import IncrementalQM
+from truth_table import TruthTableFile
+from service import SimplifyService
 
 
 class TestParser(TestCase):
@@ -10,6 +31,35 @@ class TestParser(TestCase):
         self.assertEqual(Parser("A+A").syntax_tree, Node("+", [Node("A"), Node("A")]))
         self.assertEqual(Parser("~~A").syntax_tree, Node("~", [Node("~", [Node("A")])]))
 
+    def test_names_and_whitespace(self):
+        self.assertEqual(Parser(" x1 . ~ ( carry_in+x1 ) ").syntax_tree,
+                         Node(".", [Node("x1"), Node("~", Node("+", [Node("carry_in"), Node("x1")]))]))
+        self.assertEqual(BooleanFunction(Parser("b2+a10.1").syntax_tree).ordered_unique_vars, ["a10", "b2"])
+
+    def test_stream(self):
+        expr = "(alpha.~beta)+(~alpha.beta)+gamma"
+        tokens = list(Parser.tokenize(expr))
+        for chunk_size in range(1, 8):
+            self.assertEqual(list(Parser.tokenize(io.StringIO(expr), chunk_size)), tokens)
+        self.assertEqual(Parser(io.StringIO(expr)).syntax_tree, Parser(expr).syntax_tree)
+
+    def test_deep(self):
+        depth = 50000
+        self.assertEqual(Parser("(" * depth + "A" + ")" * depth).syntax_tree, Node("A"))
+        self.assertEqual(len(str(Parser("~" * depth + "A"))), 3 * depth - 1)
+        tree = Parser("+".join("A" * depth)).syntax_tree
+        self.assertEqual(len(tree.preorder_traversal()), 2 * depth - 1)
+
+    def test_errors(self):
+        with self.assertRaisesRegex(ValueError, "Illegal token: \\$ at index 4"):
+            Parser("A + $")
+        with self.assertRaisesRegex(ValueError, "Illegal token: \\$ at index 4"):
+            Parser.validate("A + $")
+        Parser.validate("A B")
+        for expr in ["", "A+", "A B", "(A))", "A.+B", "~"]:
+            with self.assertRaises(ValueError):
+                Parser(expr)
+
 class TestNode(TestCase):
     def test___eq__basic(self):
         self.assertEqual(Node("A"), Node("A"))
@@ -52,10 +102,48 @@ class TestNode(TestCase):
         node_copy.children_hashes()
         self.assertEqual(node, node_copy)
 
+    def test__hash__does_not_reorder(self):
+        node = Parser("(~B+(C.D)).(A+B)").syntax_tree
+        hash(node)
+        self.assertEqual(node.children_values(), ["+", "+"])
+        self.assertEqual(node.children[0].children[0].value, "~")
+
+    def test_mutation_invalidates_key(self):
+        node = Parser("(A.B)+C").syntax_tree
+        self.assertEqual(node, Parser("C+(B.A)").syntax_tree)
+        node.children[0].children[1].replace_with(Node("D"))
+        self.assertNotEqual(node, Parser("C+(B.A)").syntax_tree)
+        self.assertEqual(node, Parser("C+(D.A)").syntax_tree)
+        node.children = [Node("C")]
+        self.assertEqual(node, Node("+", Node("C")))
+
     def test__str__(self):
         pass
 
 
+class TestNodeStore(TestCase):
+    def test_interning(self):
+        store = NodeStore()
+        a = Parser("(A.B)+~(B.A)", store=store).syntax_tree
+        self.assertIs(a.children[0], a.children[1].child)
+        self.assertEqual(len(store), 5)  # A, B, A.B, ~(A.B), +.
+        self.assertIs(Parser("~(B.A)+(B.A)", store=store).syntax_tree, a)
+        self.assertIsNot(Parser("(A.B)+~(B.C)", store=store).syntax_tree, a)
+
+    def test_tree_conversion(self):
+        store = NodeStore()
+        tree = Parser("(A.~B)+(~B.A)+C").syntax_tree
+        dag = store.from_tree(tree)
+        self.assertIs(dag, Parser("(A.~B)+(~B.A)+C", store=store).syntax_tree)
+        self.assertEqual(NodeStore.to_tree(dag), tree)
+        self.assertEqual(dag.canonical_key(), tree.canonical_key())
+
+    def test_boolean_function(self):
+        for expr in ["(A.~B)+(~B.A)+C", "~(A+B).(A+B)", "((A.B)+(A.B)).~((A.B)+(A.B))+1"]:
+            dag = Parser(expr, store=NodeStore()).syntax_tree
+            self.assertEqual(BooleanFunction(dag).minterms, BooleanFunction(Parser(expr).syntax_tree).minterms)
+
+
 class TestAlgebra(TestCase):
     def test_reduce_not(self):
         node = Parser("~~A").syntax_tree
@@ -80,6 +168,31 @@ class TestBooleanFunction(TestCase):
         boolean_function = BooleanFunction(Parser("(A.~B)+(~A.B)").syntax_tree)
         self.assertEqual(boolean_function.minterms, [1, 2])
 
+    def test_minterms_match_evaluate(self):
+        boolean_function = BooleanFunction(Parser("~(~(A.~(A.B)).~(B.~(C.D)))+(0.E)").syntax_tree)
+        self.assertEqual(boolean_function.minterms,
+                         [i for i in range(2 ** boolean_function.arity)
+                          if boolean_function.evaluate(boolean_function.product_as_bitstring(i))])
+
+    def test_evaluator(self):
+        boolean_function = BooleanFunction(Parser("(A.~B)+~(C+1)+(B.0)").syntax_tree)
+        evaluator = boolean_function.evaluator()
+        for i in range(2 ** boolean_function.arity):
+            bitstring = boolean_function.product_as_bitstring(i)
+            self.assertEqual(evaluator([int(char) for char in bitstring]) == 1, boolean_function.evaluate(bitstring))
+
+    def test_evaluate_batch(self):
+        boolean_function = BooleanFunction(Parser("(A.~B)+(~A.B.C)").syntax_tree)
+        var_values_list = ["000", "100", "011", "111", "101", "011"]
+        self.assertEqual(boolean_function.evaluate_batch(var_values_list),
+                         [boolean_function.evaluate(var_values) for var_values in var_values_list])
+        self.assertEqual(boolean_function.evaluate_batch([]), [])
+
+    def test_var_column(self):
+        self.assertEqual(BooleanFunction.var_column(0, 3), 0b10101010)
+        self.assertEqual(BooleanFunction.var_column(1, 3), 0b11001100)
+        self.assertEqual(BooleanFunction.var_column(2, 3), 0b11110000)
+
     def test_bitstring_and_products(self):
         boolean_function = BooleanFunction(Parser("A+B+C+D").syntax_tree)
         self.assertEqual(boolean_function.bitstring_as_product("0110"), "~A.B.C.~D")
@@ -93,6 +206,69 @@ class TestQM(TestCase):
         quine_mccluskey.bool_fn.minterms.append(0)  # don't care term.
         self.assertEqual(quine_mccluskey.prime_implicants(), {'-1-0', '-011', '0--0', '010-', '1-11', '111-', '001-'})
 
+    def test_combine_minterms(self):
+        self.assertEqual(QM.combine_minterms(["0010", "0011", "0100", "0101", "0110", "1011", "1100", "1110", "1111", "0000"]),
+                         {'-1-0', '-011', '0--0', '010-', '1-11', '111-', '001-'})
+        self.assertEqual(QM.combine_minterms(["101"]), {"101"})
+        self.assertEqual(QM.combine_minterms([]), set())
+
+    def test_combine_implicants_parallel(self):
+        implicants = [Implicant.from_minterm(minterm) for minterm in range(64) if minterm % 3 and minterm % 7]
+        min_level_size = QM.PARALLEL_MIN_LEVEL_SIZE
+        QM.PARALLEL_MIN_LEVEL_SIZE = 1
+        try:
+            self.assertEqual(QM.combine_implicants(implicants, workers=2), QM.combine_implicants(implicants))
+        finally:
+            QM.PARALLEL_MIN_LEVEL_SIZE = min_level_size
+        for workers in (2, 8):
+            tasks = QM.parallel_tasks(implicants, workers)
+            # every implicant is in exactly one part, and otherwise only sent as a partner.
+            self.assertEqual(sorted(Implicant(value, mask) for task in tasks for mask, values, partners in task
+                                    for value in values), sorted(implicants))
+        # an implicant is only sent as a partner across split bits it has a 1 in, and only if it merges there.
+        self.assertLessEqual(sum(len(partners) for task in QM.parallel_tasks(implicants, 2)
+                                 for mask, values, partners in task), len(implicants))
+
+    def test_prime_implicant_levels(self):
+        implicants = [Implicant.from_minterm(minterm) for minterm in [0, 1, 2, 3, 4, 6, 15]]
+        levels = list(QM.prime_implicant_levels(implicants))
+        self.assertEqual([{implicant.bitstring(4) for implicant in level} for level in levels],
+                         [{"1111"}, set(), {"0--0", "00--"}])
+        quine_mccluskey = QM("(A.~B)+(~A.B.C)")
+        self.assertIs(quine_mccluskey._prime_implicants(), quine_mccluskey._prime_implicants())
+        self.assertIs(quine_mccluskey.bool_fn.minterm_bitstrings, quine_mccluskey.bool_fn.minterm_bitstrings)
+
+    def test_product_of_sums(self):
+        quine_mccluskey = QM("(A+B).(C+D).(~A+E)")
+        self.assertEqual(set(quine_mccluskey.simplify(form="pos").split(".")), {"(A + B)", "(C + D)", "(~A + E)"})
+        self.assertEqual(quine_mccluskey.form, "pos")
+        self.assertEqual(quine_mccluskey.bool_fn.maxterms,
+                         [m for m in range(32) if m not in quine_mccluskey.bool_fn.minterms])
+        self.assertEqual(quine_mccluskey.simplify(form="best", verify=True).count("+"), 3)
+        self.assertEqual(quine_mccluskey.form, "pos")
+        quine_mccluskey = QM("(A.B)+(C.D)")
+        self.assertEqual(set(quine_mccluskey.simplify(form="best").split(" + ")), {"A.B", "C.D"})
+        self.assertEqual(quine_mccluskey.form, "sop")
+        self.assertEqual(QM("A+~A").simplify(form="pos"), "1")
+        self.assertEqual(QM("A.~A").simplify(form="pos", mode="heuristic"), "0")
+        self.assertTrue(equivalent(QM("(A.~B)+(C.D)+(~A.~C)").simplify(form="pos"), "(A.~B)+(C.D)+(~A.~C)"))
+        # the product of sums is verified against the input, not against the maxterms it was made from.
+        quine_mccluskey = QM("(A+B).(C+D)")
+        quine_mccluskey.bool_fn._maxterms = quine_mccluskey.bool_fn.maxterms[1:]
+        self.assertRaises(ValueError, quine_mccluskey.simplify, form="pos", verify=True)
+        self.assertFalse(quine_mccluskey.verification)
+
+    def test_from_minterms(self):
+        quine_mccluskey = QM.from_minterms(4, [1, 3, 7, 11, 15], dont_cares=[0, 2, 5])
+        self.assertEqual(quine_mccluskey.prime_implicants(), {'00--', '0--1', '--11'})
+        products = quine_mccluskey.simplify().split(" + ")
+        self.assertEqual(len(products), 2)
+        self.assertIn("C.D", products)
+        self.assertEqual(QM.from_minterms(2, [1], var_names=["x", "y"]).simplify(), "~x.y")
+        self.assertEqual(QM.from_minterms(2, [], dont_cares=[3]).simplify(), "0")
+        self.assertRaises(ValueError, QM.from_minterms, 2, [4])
+        self.assertRaises(ValueError, QM.from_minterms, 2, [1], (), ["x"])
+
     def test_first_diff_replaced_by_dash(self):
         self.assertEqual(QM.first_diff_replaced_with_dash("111-", "011-"), "-11-")
 
@@ -101,6 +277,23 @@ class TestQM(TestCase):
         self.assertFalse(QM.differs_by_one_char("1011", "0010"))
         self.assertFalse(QM.differs_by_one_char("11100", "101001"))
 
+    def test_elim_dominance(self):
+        pit = PrimeImplicantTable(['0010', '0101', '0110', '1011', '1100', '1110', '1111'],
+                                  ["0--0", "-1-0", "001-", "010-", "-011", "1-11", "111-"])
+        # 0110 and 1110 are covered by a superset of the prime implicants that cover 1100.
+        self.assertEqual(QM.elim_dominating_rows(pit), {2, 5})
+        # 001-, -011 and 111- now only cover minterms that 0--0 and 1-11 also cover.
+        self.assertEqual(QM.elim_dominated_cols(pit), {2, 4, 6})
+        self.assertEqual([name for name, comparisons, removals, seconds in pit.dominance_passes],
+                         ["dominating rows", "dominated cols"])
+
+    def test_elim_dominated_cols_literal_cost(self):
+        # --0 covers less than 00- but has fewer literals, so only 000 is dominated.
+        self.assertEqual(QM.elim_dominated_cols(PrimeImplicantTable(["000", "001"], ["--0", "00-", "000"])), {2})
+        # of identical columns the one with fewer literals is kept.
+        self.assertEqual(QM.elim_dominated_cols(PrimeImplicantTable(["001", "011"], ["0-1", "--1"])), {0})
+        self.assertEqual(QM.from_minterms(4, [1, 2, 3, 4, 5, 12, 13, 14, 15], [9, 10]).simplify().count("."), 5)
+
     def test_order_by_dominance(self):
         x = [True, False, True, True, True]
         y = [True, False, False, False, False]
@@ -141,6 +334,18 @@ class TestPrimeImplicantTable(TestCase):
 15   1111 |____|____|____|1___""")
 
 
+    def test_bitsets(self):
+        pit = PrimeImplicantTable([0b0010, 0b0101, 0b0110],
+                                  [Implicant.from_bitstring("0--0"), Implicant.from_bitstring("010-")], arity=4)
+        self.assertEqual(pit.row_bits(0), 0b01)
+        self.assertEqual(pit.col_bits(0), 0b101)
+        pit.remove_rows([0])
+        pit.remove_cols([1])
+        self.assertEqual((pit.n_rows, pit.n_cols), (2, 1))
+        self.assertEqual(pit.col_bits(0), 0b100)
+        self.assertEqual(pit.row_bits(1), 0)
+        self.assertEqual(pit.minterms, [0b0101, 0b0110])
+
     def test_matches(self):
         self.assertTrue(PrimeImplicantTable.matches("1001", "1--1"))
         self.assertTrue(PrimeImplicantTable.matches("1100", "1-00"))
@@ -149,3 +354,467 @@ class TestPrimeImplicantTable(TestCase):
 
         self.assertFalse(PrimeImplicantTable.matches("1000", "0-00"))
         self.assertFalse(PrimeImplicantTable.matches("1000", "0--1"))
+
+
+class TestImplicant(TestCase):
+    def test_bitstring_round_trip(self):
+        self.assertEqual(Implicant.from_bitstring("01-1"), Implicant(0b0101, 0b0010))
+        self.assertEqual(Implicant(0b0101, 0b0010).bitstring(4), "01-1")
+        self.assertEqual(Implicant.from_bitstring("----").bitstring(4), "----")
+
+    def test_merged(self):
+        self.assertEqual(Implicant.from_bitstring("111-").merged(Implicant.from_bitstring("011-")),
+                         Implicant.from_bitstring("-11-"))
+        self.assertIsNone(Implicant.from_bitstring("1011").merged(Implicant.from_bitstring("0010")))
+        self.assertIsNone(Implicant.from_bitstring("1-10").merged(Implicant.from_bitstring("11-0")))
+
+    def test_covers(self):
+        self.assertTrue(Implicant.from_bitstring("1--1").covers(0b1001))
+        self.assertFalse(Implicant.from_bitstring("0-00").covers(0b1000))
+
+    def test_contains_and_minterms(self):
+        self.assertTrue(Implicant.from_bitstring("1--1").contains(Implicant.from_bitstring("1-01")))
+        self.assertFalse(Implicant.from_bitstring("1-01").contains(Implicant.from_bitstring("1--1")))
+        self.assertEqual(sorted(Implicant.from_bitstring("1--1").minterms()), [0b1001, 0b1011, 0b1101, 0b1111])
+        self.assertEqual(list(Implicant.from_minterm(6).minterms()), [6])
+        check_terms([0, 15], 4)
+        self.assertRaises(ValueError, check_terms, [16], 4)
+
+
+class TestCover(TestCase):
+    def cyclic_table(self):
+        # every minterm is covered by exactly two of the six prime implicants.
+        minterms = [0, 1, 2, 5, 6, 7]
+        prime_implicants = QM.combine_implicants(Implicant.from_minterm(minterm) for minterm in minterms)
+        return PrimeImplicantTable(minterms, sorted(prime_implicants), arity=3)
+
+    def test_cyclic_core(self):
+        quine_mccluskey = QM.from_minterms(3, [0, 1, 2, 5, 6, 7])
+        self.assertEqual(len(quine_mccluskey.simplify().split(" + ")), 3)
+        self.assertTrue(quine_mccluskey.cover_result.optimal)
+
+    def test_branch_and_bound(self):
+        result = BranchAndBoundCover().solve(self.cyclic_table())
+        self.assertEqual(result.cost, (3, 6))
+        self.assertTrue(result.optimal)
+
+    def test_node_budget(self):
+        result = BranchAndBoundCover(max_nodes=0).solve(self.cyclic_table())
+        self.assertEqual(len(result.cols), 3)
+        self.assertFalse(result.optimal)
+
+    def test_components(self):
+        pit = PrimeImplicantTable(["000", "001", "110", "111"], ["00-", "11-"])
+        self.assertEqual(list(BranchAndBoundCover.components(pit)), [0b0011, 0b1100])
+
+
+class TestEspresso(TestCase):
+    def test_minimize(self):
+        self.assertEqual(set(QM("~(~(A+B).~(B+C))").simplify(mode="heuristic").split(" + ")), {"A", "B", "C"})
+        self.assertEqual(QM("A.~A").simplify(mode="heuristic"), "0")
+        self.assertEqual(QM("A+~A").simplify(mode="heuristic"), "1")
+        products = QM.from_minterms(4, [1, 3, 7, 11, 15], dont_cares=[0, 2, 5]).simplify(mode="heuristic")
+        self.assertEqual(len(products.split(" + ")), 2)
+
+    def test_wide_function(self):
+        # 24 inputs, far too many for a truth table to be practical.
+        expr_string = "+".join("(" + a + "." + b + ")" for a, b in zip("ACEGIKMOQSUW", "BDFHJLNPRTVX"))
+        quine_mccluskey = QM(expr_string)
+        self.assertEqual(len(quine_mccluskey.simplify(mode="heuristic").split(" + ")), 12)
+        self.assertIsNone(quine_mccluskey.bool_fn._minterms)
+
+    def test_complement(self):
+        cover = [Implicant.from_bitstring("1-"), Implicant.from_bitstring("-1")]
+        self.assertEqual(Espresso.complement(cover, 0b11), [Implicant.from_bitstring("00")])
+        self.assertEqual(Espresso.complement_supercube(cover, 0b11), Implicant.from_bitstring("00"))
+        self.assertTrue(Espresso.tautology(cover + Espresso.complement(cover, 0b11), 0b11))
+        self.assertFalse(Espresso.tautology(cover, 0b11))
+
+
+class TestBDD(TestCase):
+    def test_reduced_and_canonical(self):
+        manager = BDD(3)
+        f = manager.from_tree(Parser("(A.B)+(A.~B)").syntax_tree, "ABC")
+        self.assertEqual(f, manager.var(0))
+        g = manager.from_tree(Parser("~(~C+~A)+(C.~A)").syntax_tree, "ABC")
+        self.assertEqual(g, manager.from_tree(Parser("C").syntax_tree, "ABC"))
+        self.assertEqual(manager.from_tree(Parser("A.~A").syntax_tree, "ABC"), BDD.FALSE)
+
+    def test_minterms(self):
+        expr = "(A.~B)+(~A.B.C)+(D.0)"
+        boolean_function = BooleanFunction(Parser(expr).syntax_tree)
+        manager, root = BooleanFunction(Parser(expr).syntax_tree, backend="bdd").bdd()
+        self.assertEqual(list(manager.minterms(root)), boolean_function.minterms)
+        self.assertEqual(manager.satcount(root), len(boolean_function.minterms))
+        self.assertEqual(manager.any_minterm(root), 6)
+        for minterm in range(16):
+            self.assertEqual(manager.evaluate(root, minterm), minterm in boolean_function.minterms)
+
+    def test_wide(self):
+        names = ["x{}".format(i) for i in range(100)]
+        boolean_function = BooleanFunction(Parser(".".join(names) + "+~x0").syntax_tree, backend="bdd")
+        manager, root = boolean_function.bdd()
+        self.assertEqual(manager.satcount(root), 2 ** 99 + 1)
+        minterms = boolean_function.iter_minterms()
+        self.assertEqual([next(minterms) for _ in range(3)], [0, 1, 2])
+        self.assertTrue(boolean_function.evaluate("1" * 100))
+        self.assertFalse(boolean_function.evaluate("1" + "0" * 99))
+
+    def test_qm(self):
+        expr = "(A.~B)+(~A.B.C)+(D.~(A+B))"
+        self.assertEqual(QM(expr, backend="bdd").prime_implicants(), QM(expr).prime_implicants())
+
+
+class TestTruthTableFile(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_from_tree(self):
+        expr = "(A.~B)+(~A.B.C)+(D.~(A+E))+(~C.~D.E)"
+        boolean_function = BooleanFunction(Parser(expr).syntax_tree)
+        path = os.path.join(self.directory, "table")
+        for chunk_arity in (3, 4, None):
+            with TruthTableFile.from_tree(path, boolean_function.tree, "ABCDE", chunk_arity) as table:
+                self.assertEqual(table.to_int(), boolean_function.truth_table())
+                self.assertEqual(list(table.iter_minterms(chunk_bytes=1)), boolean_function.minterms)
+                self.assertEqual(list(table.iter_maxterms(chunk_bytes=3)), boolean_function.maxterms)
+                self.assertEqual(table.count(), len(boolean_function.minterms))
+                self.assertTrue(table[1])
+                self.assertFalse(table[0])
+        self.assertEqual(os.path.getsize(path), 4)
+
+    def test_existing_file(self):
+        path = os.path.join(self.directory, "table")
+        with open(path, "wb") as file:
+            file.write(bytes([0b10000001, 0, 0b1000, 0]))
+        with TruthTableFile(path) as table:
+            self.assertEqual(table.arity, 5)
+            self.assertEqual(list(table.iter_minterms()), [0, 7, 19])
+        with TruthTableFile(path, arity=5) as table:
+            self.assertEqual(list(table.iter_minterms(chunk_bytes=2)), [0, 7, 19])
+        with open(path, "wb") as file:
+            file.write(bytes([0b11111010]))
+        with TruthTableFile(path, arity=2) as table:
+            self.assertEqual(list(table.iter_minterms()), [1, 3])
+            self.assertEqual(list(table.iter_maxterms()), [0, 2])
+        self.assertRaises(ValueError, TruthTableFile, path, 4)
+        with open(path, "wb") as file:
+            file.write(bytes(3))
+        self.assertRaises(ValueError, TruthTableFile, path)
+
+    def test_qm(self):
+        expr = "(A.~B)+(~A.B.C)+(D.~(A+B))"
+        path = os.path.join(self.directory, "table")
+        with QM(expr, backend="file", truth_table_path=path) as quine_mccluskey:
+            self.assertEqual(quine_mccluskey.prime_implicants(), QM(expr).prime_implicants())
+            self.assertEqual(quine_mccluskey.simplify(verify=True), QM(expr).simplify())
+            table_file = quine_mccluskey.bool_fn.table_file()
+        self.assertTrue(table_file.buffer.closed and table_file.file.closed)
+        with QM.from_truth_table_file(path) as quine_mccluskey:
+            self.assertEqual(quine_mccluskey.simplify(verify=True), QM(expr).simplify())
+        with QM.from_truth_table_file(path, dont_cares=[0, 1, 12], var_names=["W", "X", "Y", "Z"]) as quine_mccluskey:
+            self.assertEqual(quine_mccluskey.bool_fn.dont_cares, [0, 12])
+            self.assertEqual(quine_mccluskey.simplify(form="pos", verify=True),
+                             QM.from_minterms(4, QM(expr).bool_fn.minterms, [0, 12], ["W", "X", "Y", "Z"])
+                             .simplify(form="pos"))
+        self.assertRaises(ValueError, QM, expr, backend="file")
+
+    def test_main(self):
+        path = os.path.join(self.directory, "table")
+        with TruthTableFile.from_tree(path, Parser("A.~B").syntax_tree, "ABC"):
+            pass
+        missing = os.path.join(self.directory, "missing")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(main(["-t", missing, "-t", path]), 1)
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith(missing + "\terror: FileNotFoundError"))
+        self.assertEqual(lines[1], path + "\tA.~B")
+
+
+class TestIncrementalQM(TestCase):
+    def test_deltas(self):
+        minterms, dont_cares = {0, 1, 2, 5, 6, 7, 8, 10, 14}, {15}
+        incremental = IncrementalQM(4, minterms, dont_cares)
+        for add, remove in [([3, 15], []), ([], [0, 7]), ([4, 9], [2]), ([], [15, 14]), ([0, 1, 2, 3], [])]:
+            incremental.add_minterms(add)
+            incremental.remove_minterms(remove)
+            minterms = (minterms | set(add)) - set(remove)
+            dont_cares = dont_cares - set(add) - set(remove)
+            reference = QM.from_minterms(4, minterms, dont_cares)
+            self.assertEqual(incremental.prime_implicants, reference._prime_implicants())
+            self.assertEqual(len(incremental.simplify().split(" + ")), len(reference.simplify().split(" + ")))
+            self.assertTrue(check_equivalence(reference.bool_fn,
+                                              BooleanFunction.from_implicants(incremental.cover, list("ABCD")),
+                                              dont_cares))
+
+    def test_empty(self):
+        incremental = IncrementalQM(3, [1])
+        incremental.remove_minterms([1])
+        self.assertEqual(incremental.simplify(), "0")
+        incremental.add_minterms(range(8))
+        self.assertEqual(incremental.simplify(), "1")
+        with self.assertRaises(ValueError):
+            incremental.add_minterms([8])
+
+    def test_greedy_and_table(self):
+        incremental = IncrementalQM(3, [0, 1, 2, 5, 6, 7], cover_solver=GreedyCover())
+        self.assertEqual(len(incremental.simplify().split(" + ")), 3)
+        pit = incremental.table()
+        incremental.remove_minterms([7])
+        incremental.add_minterms([3])
+        self.assertIs(incremental.table(), pit)
+        self.assertEqual(set(pit.minterms), {0, 1, 2, 3, 5, 6})
+        self.assertEqual(set(pit.prime_implicants), incremental.prime_implicants)
+        self.assertEqual(set(incremental.simplify().split(" + ")),
+                         set(QM.from_minterms(3, [0, 1, 2, 3, 5, 6]).simplify().split(" + ")))
+
+
+class TestEquivalence(TestCase):
+    def test_equivalent(self):
+        self.assertTrue(equivalent("(A.B)+(A.~B)", "A"))
+        self.assertTrue(equivalent("A+(~A.B)", "B+A+(B.0)"))
+        result = equivalent("A.B", "A+B")
+        self.assertFalse(result)
+        self.assertEqual(result.counterexample, {"A": 0, "B": 1})
+        self.assertEqual(equivalent("A", "A+(B.~B)"), Equivalence(True, None))
+
+    def test_wide(self):
+        names = ["x{}".format(i) for i in range(40)]
+        expr = "+".join("({}.~{})".format(a, b) for a, b in zip(names, names[1:]))
+        self.assertTrue(equivalent(expr, "(" + expr + ").(" + expr + "+x7)"))
+        result = equivalent(expr, "(" + expr + ").~(x38.x39)")
+        self.assertFalse(result)
+        self.assertEqual((result.counterexample["x38"], result.counterexample["x39"]), (1, 1))
+
+    def test_simplify_verify(self):
+        quine_mccluskey = QM("(A.~B)+(~A.B.C)+(A.B.C)")
+        quine_mccluskey.simplify(verify=True)
+        self.assertTrue(quine_mccluskey.verification)
+        quine_mccluskey = QM.from_minterms(4, [1, 3, 7, 11, 15], dont_cares=[0, 2, 5])
+        quine_mccluskey.simplify(verify=True)
+        self.assertTrue(quine_mccluskey.verification)
+        quine_mccluskey.essential_prime_implicants = lambda verbose, cover_solver: {Implicant(0b0011, 0b1100)}
+        with self.assertRaises(ValueError):
+            quine_mccluskey.simplify(verify=True)
+        self.assertEqual(quine_mccluskey.verification.counterexample, {"A": 0, "B": 0, "C": 0, "D": 1})
+
+
+class TestStats(TestCase):
+    def test_stages(self):
+        events = []
+        quine_mccluskey = QM("(A.~B)+(~A.B.C)+(A.B.~D)+(C.D)", stats=Stats(callback=events.append))
+        quine_mccluskey.simplify(verify=True)
+        self.assertEqual(events, quine_mccluskey.stats.events)
+        stages = [event["stage"] for event in events]
+        self.assertEqual(stages[:3], ["parse", "minterms", "combine level"])
+        self.assertEqual(stages[-2:], ["verify", "simplify"])
+        self.assertIn("essential cols", stages)
+        self.assertEqual([event["level"] for event in events if event["stage"] == "combine level"], [0, 1, 2])
+        table = next(event for event in events if event["stage"] == "table")
+        self.assertEqual((table["rows"], table["cols"]), (10, 5))
+        self.assertEqual(list(quine_mccluskey.stats.stage_seconds())[:2], ["parse", "minterms"])
+        self.assertEqual(len(quine_mccluskey.stats.to_json().splitlines()), len(events))
+
+    def test_cyclic_core(self):
+        quine_mccluskey = QM.from_minterms(3, [0, 1, 2, 5, 6, 7])
+        quine_mccluskey.simplify()
+        core = [event for event in quine_mccluskey.stats.events if event["stage"] == "cyclic core"]
+        self.assertEqual(len(core), 1)
+        self.assertEqual((core[0]["rows"], core[0]["cols"], core[0]["cost"]), (6, 6, (3, 6)))
+
+
+class TestMultiOutputQM(TestCase):
+    def test_tagged_prime_implicants(self):
+        # A.B is an implicant of both outputs, A and B are prime implicants of one output each.
+        tagged = MultiOutputQM(["A", "B"]).tagged_prime_implicants()
+        self.assertEqual(tagged, {Implicant.from_bitstring("11"): 0b11,
+                                  Implicant.from_bitstring("1-"): 0b01,
+                                  Implicant.from_bitstring("-1"): 0b10})
+
+    def test_simplify(self):
+        multi_output_qm = MultiOutputQM(["(A.B)+(A.C)", "(A.B)+(~A.C)", "A.B.C", "0"])
+        results = multi_output_qm.simplify()
+        self.assertEqual(set(results[0].split(" + ")), {"A.B", "A.C"})
+        self.assertEqual(set(results[1].split(" + ")), {"A.B", "~A.C"})
+        self.assertEqual(results[2:], ["A.B.C", "0"])
+
+    def test_shared_products(self):
+        # separately ~B.~C + A.~B and ~A.~B.~C need 3 products. Together ~A.~B.~C can be shared.
+        results = MultiOutputQM(["(~A.~B.~C)+(A.~B)", "~A.~B.~C"]).simplify()
+        self.assertEqual(set(results[0].split(" + ")), {"A.~B", "~A.~B.~C"})
+        self.assertEqual(results[1], "~A.~B.~C")
+
+
+class TestBatch(TestCase):
+    def test_simplify_many(self):
+        expr_strings = ["A+A", "A+$", "(A.~B)+(~A.B)", "A.~A"]
+        for workers in (1, 2):
+            results = list(simplify_many(expr_strings, workers=workers, chunksize=1))
+            self.assertEqual([result.expr_string for result in results], expr_strings)
+            self.assertEqual(results[0].result, "A")
+            self.assertIsNone(results[1].result)
+            self.assertEqual(results[1].error, "ValueError: Illegal token: $ at index 2")
+            self.assertEqual(set(results[2].result.split(" + ")), {"~A.B", "A.~B"})
+            self.assertEqual(results[3], BatchResult("A.~A", "0", None))
+        self.assertRaises(ValueError, list, simplify_many(expr_strings, workers=1, chunksize=0))
+
+
+class TestService(TestCase):
+    def test_coalescing(self):
+        async def run():
+            async with SimplifyService(workers=1) as service:
+                results = await asyncio.gather(service.simplify("(A.B)+(A.~B)"), service.simplify("(A.~B)+(B.A)"),
+                                               service.simplify("(A.B)+(A.~B)", form="pos"),
+                                               service.simplify("A+$"))
+                return results, service.metrics()
+        results, metrics = asyncio.run(run())
+        self.assertEqual(results[0], BatchResult("(A.B)+(A.~B)", "A", None))
+        self.assertEqual(results[1], BatchResult("(A.~B)+(B.A)", "A", None))
+        self.assertEqual(results[2].result, "A")
+        self.assertEqual(results[3].error, "ValueError: Illegal token: $ at index 2")
+        self.assertEqual((metrics["requests"], metrics["coalesced"], metrics["errors"]), (4, 1, 1))
+        self.assertEqual((metrics["queue_depth"], metrics["in_flight"]), (0, 0))
+        self.assertGreaterEqual(metrics["latency_max"], metrics["latency_p50"])
+
+    def test_cancelled_error(self):
+        class BrokenExecutor(concurrent.futures.ThreadPoolExecutor):
+            def submit(self, fn, *args):
+                if fn is int:
+                    return super().submit(fn, *args)
+                raise RuntimeError("broken")
+
+        async def run():
+            errors = []
+            asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+            with BrokenExecutor(1) as executor:
+                async with SimplifyService(workers=1, executor=executor) as service:
+                    self.assertNotEqual(service.key("(A.B)+~C", {}), service.key("(A.B)+~D", {}))
+                    self.assertEqual(service.key("(A.B)+~C", {}), service.key("~C+(B.A)", {}))
+                    # not assertRaises, which would clear the frame of the worker in the traceback of the error.
+                    self.assertIsInstance((await asyncio.gather(service.simplify("A.B"), return_exceptions=True))[0],
+                                          RuntimeError)
+                    task = asyncio.ensure_future(service.simplify("A+B"))
+                    await asyncio.sleep(0)
+                    task.cancel()
+                    while service.in_flight:
+                        await asyncio.sleep(0)
+                    del task
+                    gc.collect()
+            return errors
+        self.assertEqual(asyncio.run(run()), [])
+
+    def test_close_and_invalid_options(self):
+        async def run():
+            service = await SimplifyService(workers=1, max_queue=2).start()
+            result = await service.simplify("A", mode=["x"])
+            tasks = [asyncio.ensure_future(service.simplify(expr)) for expr in ["A.B", "A+B", "A.~B", "~A+B"]]
+            await asyncio.sleep(0)
+            await service.close()
+            await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), 5)
+            return result, tasks, service.metrics()
+        result, tasks, metrics = asyncio.run(run())
+        self.assertEqual(result.error, "ValueError: Invalid value for option mode: ['x']")
+        self.assertTrue(all(task.done() for task in tasks))
+        self.assertEqual((metrics["requests"], metrics["completed"], metrics["errors"]), (5, 1, 1))
+        self.assertEqual((metrics["queue_depth"], metrics["in_flight"]), (0, 0))
+
+    def test_backpressure(self):
+        expr_strings = ["A.B", "A+B", "A.~B", "~A+B", "A.B.C", "A+B+C"]
+        stats = Stats()
+
+        async def run():
+            async with SimplifyService(workers=1, max_queue=2, stats=stats) as service:
+                return await asyncio.gather(*map(service.simplify, expr_strings)), service.metrics()
+        results, metrics = asyncio.run(run())
+        self.assertEqual([result.result for result in results], [QM(expr).simplify() for expr in expr_strings])
+        self.assertEqual(metrics["max_queue_depth"], 2)
+        self.assertEqual(len(stats.events), len(expr_strings))
+
+    def test_http(self):
+        async def request(port, message):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(message.encode())
+            response = await reader.read()
+            writer.close()
+            head, _, body = response.decode().partition("\r\n\r\n")
+            return head.split("\r\n")[0], json.loads(body)
+
+        async def run():
+            async with SimplifyService(workers=1) as service:
+                server = await service.serve(port=0)
+                port = server.sockets[0].getsockname()[1]
+                body = json.dumps({"expr": "(A.B)+(~A.B)", "verify": True})
+                responses = [await request(port, "POST /simplify HTTP/1.0\r\nContent-Length: {}\r\n\r\n{}".format(
+                    len(body), body))]
+                responses.append(await request(port, "GET /metrics HTTP/1.0\r\n\r\n"))
+                responses.append(await request(port, "GET /nothing HTTP/1.0\r\n\r\n"))
+                responses.append(await request(port, "POST /simplify HTTP/1.0\r\nContent-Length: 2\r\n\r\n{}"))
+                server.close()
+                await server.wait_closed()
+                return responses
+        responses = asyncio.run(run())
+        self.assertEqual(responses[0], ("HTTP/1.0 200 OK", {"expr_string": "(A.B)+(~A.B)", "result": "B",
+                                                             "error": None}))
+        self.assertEqual(responses[1][1]["completed"], 1)
+        self.assertEqual(responses[2][0], "HTTP/1.0 404 Not Found")
+        self.assertEqual(responses[3], ("HTTP/1.0 400 Bad Request", {"error": "KeyError: 'expr'"}))
+
+
+class TestSimplifyCache(TestCase):
+    def test_hits(self):
+        cache = SimplifyCache(maxsize=2)
+        self.assertEqual(QM("(A.~B)+(~A.B)+(A.B)").simplify(cache=cache).count("+"), 1)
+        # reordered operands and renamed variables are the same function.
+        self.assertEqual(set(QM("(B.A)+(~B.A)+(B.~A)").simplify(cache=cache).split(" + ")), {"A", "B"})
+        self.assertEqual(set(QM("X+Y").simplify(cache=cache).split(" + ")), {"X", "Y"})
+        self.assertEqual(cache.stats()["hits"], 2)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_solver_and_copies(self):
+        cache = SimplifyCache()
+        expr = "(A.B)+(A.~B)+(~A.B)"
+        QM(expr).simplify(cover_solver=GreedyCover(), cache=cache)
+        QM(expr).simplify(cache=cache)
+        QM(expr).simplify(cover_solver=BranchAndBoundCover(), cache=cache)
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 2))
+        key = cache.fingerprint(QM(expr).bool_fn, "exact")
+        cache.get(key).clear()
+        self.assertEqual(len(cache.get(key)), 2)
+
+    def test_lru_eviction(self):
+        cache = SimplifyCache(maxsize=2)
+        for expr_string in ["A", "A.B", "A+B", "A"]:
+            QM(expr_string).simplify(cache=cache)
+        self.assertEqual(cache.stats()["misses"], 4)
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_persistent(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with SimplifyCache(path=os.path.join(directory, "cache")) as cache:
+                QM("(A.B)+(A.~B)").simplify(cache=cache)
+            with SimplifyCache(path=os.path.join(directory, "cache")) as cache:
+                self.assertEqual(QM("(A.~B)+(A.B)").simplify(cache=cache), "A")
+                self.assertEqual(cache.stats()["disk_hits"], 1)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_wide_fingerprint_hash_seed(self):
+        # above MAX_TRUTH_TABLE_ARITY variables the fingerprint comes from the tree, and must be the same in
+        # every process for the persistent tier to hit.
+        expr = "+".join("(x{}.~x{})".format(i, i + 1) for i in range(SimplifyCache.MAX_TRUTH_TABLE_ARITY + 1))
+        script = "from cache import SimplifyCache; from quine_mccluskey import QM; " \
+                 "print(SimplifyCache.fingerprint(QM({!r}).bool_fn, 'exact'))".format(expr)
+        fingerprints = {SimplifyCache.fingerprint(QM(expr).bool_fn, "exact")}
+        for seed in ("1", "2"):
+            fingerprints.add(subprocess.check_output([sys.executable, "-c", script], text=True,
+                                                     cwd=os.path.dirname(os.path.abspath(__file__)),
+                                                     env=dict(os.environ, PYTHONHASHSEED=seed)).strip())
+        self.assertEqual(len(fingerprints), 1)
+        self.assertNotEqual(QM(expr).bool_fn.tree.stable_digest(), QM(expr + "+x0").bool_fn.tree.stable_digest())
+        self.assertEqual(Parser("(A.B)+~C").syntax_tree.stable_digest(),
+                         Parser("~C+(B.A)").syntax_tree.stable_digest())
@@ -0,0 +1,114 @@
+import mmap
+import os
+
+from utils import BooleanFunction, check_terms, popcount, set_bits
+
+
+class TruthTableFile:
+    """A truth table kept as a packed bit array in a memory-mapped file, so that functions of many variables
+    never have their whole truth table, or all their minterms, in the Python heap at once.
+
+    Bit i of the table (bit i % 8 of byte i // 8) is the value of the function for input i, the first variable
+    being the most significant bit of i: the same layout as pack_bits and BooleanFunction.truth_table.
+    The file holds nothing else, so it is 2 ** arity / 8 bytes (1 byte below 3 variables) and the arity of an
+    existing file, e.g. one exported from a simulator, is read off its size.
+    The table is read and written in chunks of at most CHUNK_BYTES bytes."""
+    CHUNK_BYTES = 1 << 16
+
+    def __init__(self, path, arity=None, writable=False):
+        """Map an existing table file. arity is checked against the size of the file if given; without it,
+        a 1 byte file is taken to have 3 variables."""
+        self.path = path
+        size = os.path.getsize(path)
+        if arity is None:
+            arity = (size * 8).bit_length() - 1
+            if size == 0 or size * 8 != 1 << arity:
+                raise ValueError("Truth table file size is not a power of 2 bytes: {}".format(size))
+        elif size != TruthTableFile.n_bytes(arity):
+            raise ValueError("Expected a truth table file of {} bytes for {} variables, got {}".format(
+                TruthTableFile.n_bytes(arity), arity, size))
+        self.arity = arity
+        self.file = open(path, "r+b" if writable else "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+
+    @classmethod
+    def create(cls, path, arity):
+        """Make a table file of arity variables that is 0 everywhere, and map it for writing."""
+        with open(path, "wb") as file:
+            file.truncate(TruthTableFile.n_bytes(arity))
+        return cls(path, arity, writable=True)
+
+    @classmethod
+    def from_tree(cls, path, tree, ordered_vars, chunk_arity=None):
+        """Write the truth table of a syntax tree to a new file, one chunk of 2 ** chunk_arity inputs at a time
+        (CHUNK_BYTES bytes by default, and at least a byte). Within a chunk the last chunk_arity variables are
+        packed columns, as in BooleanFunction.truth_table, and the others are constant, so the tree is compiled
+        once and evaluated once per chunk."""
+        arity = len(ordered_vars)
+        table = cls.create(path, arity)
+        if chunk_arity is None:
+            chunk_arity = (TruthTableFile.CHUNK_BYTES * 8).bit_length() - 1
+        chunk_arity = min(max(chunk_arity, 3), arity)
+        evaluator = BooleanFunction.compile_tree(tree, ordered_vars)
+        full = (1 << 2 ** chunk_arity) - 1
+        columns = [BooleanFunction.var_column(bit, chunk_arity) for bit in reversed(range(chunk_arity))]
+        chunk_bytes = TruthTableFile.n_bytes(chunk_arity)
+        for chunk_index in range(2 ** (arity - chunk_arity)):
+            constants = [full if chunk_index >> bit & 1 else 0 for bit in reversed(range(arity - chunk_arity))]
+            bits = evaluator(constants + columns, full)
+            start = chunk_index * chunk_bytes
+            table.buffer[start:start + chunk_bytes] = bits.to_bytes(chunk_bytes, "little")
+        table.buffer.flush()
+        return table
+
+    @staticmethod
+    def n_bytes(arity):
+        return max(2 ** arity // 8, 1)
+
+    def __getitem__(self, minterm):
+        """Return the value of the function for the input minterm."""
+        check_terms([minterm], self.arity)
+        return self.buffer[minterm >> 3] >> (minterm & 7) & 1 == 1
+
+    def chunks(self, chunk_bytes=None):
+        """Yield (index of the first input, packed bits) for each chunk of the table, in order."""
+        if chunk_bytes is None:
+            chunk_bytes = TruthTableFile.CHUNK_BYTES
+        # below 3 variables the bits past the table in its only byte are ignored.
+        full = (1 << min(2 ** self.arity, chunk_bytes * 8)) - 1
+        for start in range(0, len(self.buffer), chunk_bytes):
+            yield start * 8, int.from_bytes(self.buffer[start:start + chunk_bytes], "little") & full
+
+    def iter_minterms(self, chunk_bytes=None):
+        """Yield the inputs for which the function is 1 in ascending order, reading one chunk at a time."""
+        for offset, bits in self.chunks(chunk_bytes):
+            for index in set_bits(bits):
+                yield offset + index
+
+    def iter_maxterms(self, chunk_bytes=None):
+        """Yield the inputs for which the function is 0 in ascending order, reading one chunk at a time."""
+        if chunk_bytes is None:
+            chunk_bytes = TruthTableFile.CHUNK_BYTES
+        for offset, bits in self.chunks(chunk_bytes):
+            full = (1 << min(chunk_bytes * 8, 2 ** self.arity - offset)) - 1
+            for index in set_bits(full & ~bits):
+                yield offset + index
+
+    def count(self):
+        """Return the number of minterms."""
+        return sum(popcount(bits) for _, bits in self.chunks())
+
+    def to_int(self):
+        """Return the whole truth table packed into an int, as BooleanFunction.truth_table does."""
+        full = (1 << 2 ** self.arity) - 1
+        return int.from_bytes(self.buffer[:], "little") & full
+
+    def close(self):
+        self.buffer.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,4 +1,9 @@
 import copy
+import hashlib
+import io
+import re
+import weakref
+from collections import namedtuple
 
 CONST = ("1", "0")
 OP = ("+", ".")
@@ -7,19 +12,119 @@ PAREN = ("(", ")")
 
 
 class BooleanFunction:
-    def __init__(self, tree):
+    BACKENDS = ("truth_table", "bdd", "file")
+
+    def __init__(self, tree, var_names=None, backend="truth_table", truth_table_path=None):
+        """var_names fixes the variables (and their order) of the function, e.g. to share them between
+        several functions. By default they are the variables of the tree in sorted order.
+        With backend="bdd", minterms and evaluate are computed from a reduced ordered BDD of the tree
+        instead of the packed truth table, which is much smaller for functions with compact structure.
+        With backend="file", the truth table is written in chunks to a memory-mapped file at truth_table_path
+        (see truth_table.TruthTableFile) and the minterms are streamed from it, so neither the truth table
+        nor the list of minterms has to fit in memory."""
+        if backend not in BooleanFunction.BACKENDS:
+            raise ValueError("Invalid backend: " + str(backend))
+        if backend == "file" and truth_table_path is None:
+            raise ValueError("The file backend needs a truth_table_path")
+        # ordered_unique_vars reads the tree.
         self.tree = tree
-        self.ordered_unique_vars = self.ordered_unique_vars()
+        self._init(tree, self.ordered_unique_vars() if var_names is None else var_names, backend, truth_table_path)
+
+    def _init(self, tree, var_names, backend="truth_table", truth_table_path=None, minterms=None, dont_cares=(),
+              table_file=None):
+        """Set the attributes of a new boolean function. Every constructor goes through here."""
+        self.tree = tree
+        self.ordered_unique_vars = list(var_names)
         self.arity = len(self.ordered_unique_vars)
-        # Minterms are the product terms from the sum of products (SoP) representation of the boolean function.
-        # Each minterm dictates exactly one possible combination of arguments to the function that result in True.
-        self.minterms = self.minterms()
+        self.backend = backend
+        self.truth_table_path = truth_table_path
+        self._evaluator = None
+        self._truth_table = None
+        self._minterms = minterms
+        self._maxterms = None
+        self._minterm_bitstrings = None
+        self._bdd = None
+        self._table_file = table_file
+        # Don't cares are inputs for which the value of the function does not matter.
+        self.dont_cares = list(dont_cares)
+
+    @classmethod
+    def from_minterms(cls, arity, minterms, dont_cares=(), var_names=None):
+        """Make a boolean function directly from its minterms, without a syntax tree.
+        var_names defaults to "A", "B", ... (or "x0", "x1", ... above 26 variables),
+        with the first name being the most significant bit of a minterm."""
+        var_names = BooleanFunction.checked_var_names(arity, var_names)
+        minterms = sorted(set(minterms))
+        dont_cares = sorted(set(dont_cares).difference(minterms))
+        check_terms(minterms[:1] + minterms[-1:] + dont_cares[:1] + dont_cares[-1:], arity)
+        boolean_function = cls.__new__(cls)
+        boolean_function._init(None, var_names, minterms=minterms, dont_cares=dont_cares)
+        return boolean_function
+
+    @classmethod
+    def from_truth_table_file(cls, table_file, dont_cares=(), var_names=None):
+        """Make a boolean function of the file backend from a truth_table.TruthTableFile, without a syntax tree.
+        The minterms are streamed from the file rather than listed. var_names defaults as in from_minterms."""
+        var_names = BooleanFunction.checked_var_names(table_file.arity, var_names)
+        dont_cares = sorted(set(dont_cares))
+        check_terms(dont_cares[:1] + dont_cares[-1:], table_file.arity)
+        boolean_function = cls.__new__(cls)
+        boolean_function._init(None, var_names, "file", table_file.path,
+                               dont_cares=[term for term in dont_cares if not table_file[term]], table_file=table_file)
+        return boolean_function
+
+    @classmethod
+    def from_implicants(cls, implicants, var_names):
+        """Make the boolean function that is the sum of the products of implicants (as in the output of
+        QM.simplify), with a syntax tree of one "+" node over the products."""
+        arity = len(var_names)
+        products = []
+        for implicant in implicants:
+            literals = []
+            for index, var in enumerate(var_names):
+                bit = 1 << (arity - 1 - index)
+                if not implicant.mask & bit:
+                    literals.append(Node(var) if implicant.value & bit else Node("~", Node(var)))
+            if not literals:
+                products.append(Node("1"))
+            else:
+                products.append(literals[0] if len(literals) == 1 else Node(".", literals))
+        if not products:
+            tree = Node("0")
+        else:
+            tree = products[0] if len(products) == 1 else Node("+", products)
+        return cls(tree, var_names)
+
+    @staticmethod
+    def checked_var_names(arity, var_names):
+        """Return var_names, or the default_var_names if it is None, checking that there are arity of them."""
+        if var_names is None:
+            var_names = BooleanFunction.default_var_names(arity)
+        if len(var_names) != arity:
+            raise ValueError("Expected {} variable names, got {}".format(arity, len(var_names)))
+        return var_names
+
+    @staticmethod
+    def default_var_names(arity):
+        if arity <= 26:
+            return [chr(ord("A") + i) for i in range(arity)]
+        return ["x" + str(i) for i in range(arity)]
 
     @property
     def minterm_bitstrings(self):
-        return [self.product_as_bitstring(minterm) for minterm in self.minterms]
+        """The minterms as bitstrings, built on first access."""
+        if self._minterm_bitstrings is None:
+            self._minterm_bitstrings = [self.product_as_bitstring(minterm) for minterm in self.iter_minterms()]
+        return self._minterm_bitstrings
 
     def evaluate(self, var_values):
+        if self.backend == "bdd":
+            manager, root = self.bdd()
+            return manager.evaluate(root, int(var_values or "0", 2))
+        if self.backend == "file":
+            return self.table_file()[int(var_values or "0", 2)]
+        if self.tree is None:
+            return int(var_values or "0", 2) in set(self.minterms)
         return self._evaluate_helper(self.tree, dict(zip(self.ordered_unique_vars,
                                                          [True if value == "1" else False for value in var_values])))
 
@@ -41,21 +146,220 @@ class BooleanFunction:
         else:
             raise ValueError("Invalid node value: " + str(node.value))
 
+    @property
     def minterms(self):
-        minterms = []
-        if self.arity == 0:
+        """Minterms are the product terms from the sum of products (SoP) representation of the boolean function.
+        Each minterm dictates exactly one possible combination of arguments to the function that result in True.
+        They are computed from the truth table on first access."""
+        if self._minterms is None:
+            if self.arity == 0:
+                self._minterms = []
+            elif self.backend in ("bdd", "file"):
+                self._minterms = list(self.iter_minterms())
+            else:
+                self._minterms = set_bits(self.truth_table())
+        return self._minterms
+
+    @property
+    def maxterms(self):
+        """The inputs for which the function is 0, except the don't cares. They come from the same truth table
+        as the minterms (or, with the bdd backend, from the negation of the same BDD)."""
+        if self._maxterms is None:
+            if self.arity == 0:
+                self._maxterms = []
+            elif self.backend == "bdd":
+                manager, root = self.bdd()
+                dont_cares = set(self.dont_cares)
+                self._maxterms = [maxterm for maxterm in manager.minterms(manager.negate(root))
+                                  if maxterm not in dont_cares]
+            elif self.backend == "file":
+                dont_cares = set(self.dont_cares)
+                self._maxterms = [maxterm for maxterm in self.table_file().iter_maxterms()
+                                  if maxterm not in dont_cares]
+            else:
+                full = (1 << 2 ** self.arity) - 1
+                self._maxterms = set_bits(full & ~self.truth_table() & ~pack_bits(self.dont_cares, 2 ** self.arity))
+        return self._maxterms
+
+    def iter_minterms(self):
+        """Yield the minterms in ascending order. With the bdd backend they are drawn from the BDD one at a time
+        (unless the minterms were already listed), so 2 ** arity inputs are never enumerated. With the file
+        backend they are read from the file one chunk at a time."""
+        if self.backend == "bdd" and self._minterms is None and self.arity > 0:
+            manager, root = self.bdd()
+            return manager.minterms(root)
+        if self.backend == "file" and self._minterms is None and self.arity > 0:
+            return self.table_file().iter_minterms()
+        return iter(self.minterms)
+
+    def bdd(self):
+        """Return (manager, root): a BDD manager holding the function, and the node of the function in it."""
+        if self._bdd is None:
+            from bdd import BDD
+            manager = BDD(self.arity)
+            self._bdd = manager, manager.from_tree(self.tree, self.ordered_unique_vars)
+        return self._bdd
+
+    def table_file(self):
+        """Return the truth_table.TruthTableFile of the function, writing it from the tree on first call."""
+        if self._table_file is None:
+            from truth_table import TruthTableFile
+            self._table_file = TruthTableFile.from_tree(self.truth_table_path, self.tree, self.ordered_unique_vars)
+        return self._table_file
+
+    def close(self):
+        """Close the truth table file of the file backend, if it is open. A function made from a file can not be
+        used after that; one made from a tree writes the file again when it is next needed."""
+        if self._table_file is not None:
+            self._table_file.close()
+            self._table_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def truth_table(self):
+        """Return the truth table packed into an int: bit i is the value of the function for input i.
+        The tree is evaluated once, with every variable replaced by the packed column of its values
+        over all 2 ** arity inputs, so "+", "." and "~" become OR, AND and NOT on whole columns.
+        A function made from minterms (without a tree) packs its minterms instead.
+        The tree is only walked once here, so unless it is already compiled it is interpreted
+        (see interpret_tree), which saves the compilation of a single use. The result is kept, so minterms
+        and maxterms come from the same sweep."""
+        if self._truth_table is None:
+            if self.backend == "file":
+                self._truth_table = self.table_file().to_int()
+            elif self.tree is None:
+                self._truth_table = pack_bits(self.minterms, 2 ** self.arity)
+            else:
+                full = (1 << 2 ** self.arity) - 1
+                columns = [BooleanFunction.var_column(self.arity - 1 - i, self.arity) for i in range(self.arity)]
+                if self._evaluator is None:
+                    self._truth_table = BooleanFunction.interpret_tree(self.tree, self.ordered_unique_vars,
+                                                                       columns, full)
+                else:
+                    self._truth_table = self.evaluator()(columns, full)
+        return self._truth_table
+
+    def evaluate_batch(self, var_values_list):
+        """Return [self.evaluate(var_values) for var_values in var_values_list], computed in one pass
+        by packing the values of each variable across all the input vectors into an int."""
+        var_values_list = list(var_values_list)
+        if not var_values_list:
             return []
-        for i in range(2 ** self.arity):
-            if self.evaluate(self.product_as_bitstring(i)):
-                minterms.append(i)
-        return minterms
+        full = (1 << len(var_values_list)) - 1
+        columns = [int("".join(var_values[i] for var_values in reversed(var_values_list)), 2)
+                   for i in range(self.arity)]
+        results = self.evaluator()(columns, full)
+        return [results >> i & 1 == 1 for i in range(len(var_values_list))]
+
+    def evaluator(self):
+        """Return the compiled form of self.tree as a function f(var_values, full=1).
+        var_values holds one int per variable in ordered_unique_vars. With 0/1 ints and full=1 it is a
+        fast equivalent of evaluate. With packed columns and full set to all ones it evaluates
+        many inputs at once."""
+        if self._evaluator is None:
+            self._evaluator = BooleanFunction.compile_tree(self.tree, self.ordered_unique_vars)
+        return self._evaluator
+
+    @staticmethod
+    def interpret_tree(tree, ordered_vars, var_values, full=1):
+        """Return what the compiled evaluator of tree would return for var_values, by walking the tree."""
+        slots = {var: index for index, var in enumerate(ordered_vars)}
+        results = {}
+        stack = [(tree, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if id(node) in results:
+                continue
+            if not children_done and not node.is_terminal():
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+                continue
+            if node.is_terminal():
+                if node.value in CONST:
+                    result = full if node.value == "1" else 0
+                elif node.value in slots:
+                    result = var_values[slots[node.value]]
+                else:
+                    raise ValueError("Invalid terminal value: " + str(node.value))
+            elif node.value == "+":
+                result = 0
+                for child in node.children:
+                    result |= results[id(child)]
+            elif node.value == ".":
+                result = full
+                for child in node.children:
+                    result &= results[id(child)]
+            elif node.value == "~":
+                result = full ^ results[id(node.child)]
+            else:
+                raise ValueError("Invalid node value: " + str(node.value))
+            results[id(node)] = result
+        return results[id(tree)]
+
+    @staticmethod
+    def compile_tree(tree, ordered_vars):
+        """Compile tree into straight-line Python code, one assignment per node, using
+        "|", "&" and "^ full" for "+", "." and "~"."""
+        slots = {var: index for index, var in enumerate(ordered_vars)}
+        lines = []
+        names = {}
+        stack = [(tree, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if id(node) in names:
+                # a subexpression shared in a DAG is computed once.
+                continue
+            if not children_done and not node.is_terminal():
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+                continue
+            if node.is_terminal():
+                if node.value in CONST:
+                    expr = "full" if node.value == "1" else "0"
+                elif node.value in slots:
+                    expr = "v[{}]".format(slots[node.value])
+                else:
+                    raise ValueError("Invalid terminal value: " + str(node.value))
+            elif node.value == "+":
+                expr = " | ".join(names[id(child)] for child in node.children)
+            elif node.value == ".":
+                expr = " & ".join(names[id(child)] for child in node.children)
+            elif node.value == "~":
+                expr = "full ^ " + names[id(node.child)]
+            else:
+                raise ValueError("Invalid node value: " + str(node.value))
+            names[id(node)] = "t{}".format(len(lines))
+            lines.append("    {} = {}".format(names[id(node)], expr))
+        source = "def evaluator(v, full=1):\n" + "\n".join(lines) + "\n    return {}\n".format(names[id(tree)])
+        namespace = {}
+        exec(source, namespace)
+        return namespace["evaluator"]
+
+    @staticmethod
+    def var_column(bit, arity):
+        """Return the packed column of a variable over all 2 ** arity inputs:
+        bit i of the result is bit number bit of i. example: var_column(1, 3) -> 0b11001100."""
+        half_period = 1 << bit
+        column = ((1 << half_period) - 1) << half_period
+        length = 2 * half_period
+        while length < 2 ** arity:
+            column |= column << length
+            length *= 2
+        return column
 
     def product_as_bitstring(self, minterm):
         """example: "A.~B.C" -> "101"."""
         return bin(minterm)[2:].rjust(self.arity, "0")
 
     def bitstring_as_product(self, implicant):
-        """example: "0110" -> "~A.B.C.~D."""
+        """example: "0110" -> "~A.B.C.~D.
+        implicant may also be an Implicant, which is converted to a bitstring here."""
+        if isinstance(implicant, Implicant):
+            implicant = implicant.bitstring(self.arity)
         var_states = []
         if self.arity == implicant.count("-"):
             return "1"
@@ -66,8 +370,35 @@ class BooleanFunction:
                 var_states.append(var)
         return ".".join(var_states)
 
+    def bitstring_as_sum(self, implicant):
+        """Return the sum that is the complement of the product of implicant, i.e. a clause of a product
+        of sums. example: "0110" -> "A + ~B + ~C + D"."""
+        if isinstance(implicant, Implicant):
+            implicant = implicant.bitstring(self.arity)
+        var_states = []
+        if self.arity == implicant.count("-"):
+            return "0"
+        for state, var in zip(implicant, self.ordered_unique_vars):
+            if state == "0":
+                var_states.append(var)
+            elif state == "1":
+                var_states.append("~" + var)
+        return " + ".join(var_states)
+
     def ordered_unique_vars(self):
-        return sorted(filter(lambda char: char.isalpha(), set(self.tree.preorder_traversal())))
+        """Return the sorted variable names in tree. Shared subtrees (of a DAG) are visited once."""
+        names = set()
+        seen = set()
+        stack = [self.tree]
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if node.is_terminal():
+                names.add(node.value)
+            stack.extend(node.children)
+        return sorted(name for name in names if name not in CONST)
 
 
 # Reduction of boolean function using some algebraic properties.
@@ -102,7 +433,7 @@ class Algebra:
                                                                    children=[node for node in
                                                                              left_child.children + right_child.children
                                                                              if node != common_node])]))
-                except IndexError:
+                except (IndexError, KeyError):  # No child is common to both sides.
                     pass
                 # left_child.children.sort(key=lambda node: node._preorder_traversal())
                 # right_child.children.sort(key=lambda node: node._preorder_traversal())
@@ -137,67 +468,117 @@ class Algebra:
 
 
 class Parser:
-    def __init__(self, string):
-        string = string.replace(" ", "")
-        Parser.validate(string)
-        self.tokens = string
-        self.token_index = 0
-        self.syntax_tree = self.parse_expr()
+    """Parses expressions in a single pass over the input with an explicit stack, so neither the length
+    nor the nesting depth of an expression is limited by the recursion limit.
+
+    expr := term (op term)*, where the binary ops have equal precedence and group to the left.
+    term := '1' | '0' | name | '(' expr ')' | unary_op term. A name is a letter or "_" followed by letters,
+    digits or "_". Whitespace is ignored. Parentheses still open at the end of the input are closed."""
+    TOKEN = re.compile(r"[^\W\d]\w*|\S")
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, source, store=None):
+        """source is a string or a file-like object with a read method. With a store (a dag.NodeStore), the
+        syntax tree is built directly as an interned DAG of DagNodes instead of a tree of Nodes."""
+        self.store = store
+        self.syntax_tree = self.parse(Parser.tokenize(source))
+
+    def make_node(self, value, children=()):
+        if self.store is not None:
+            return self.store.node(value, children)
+        return Node.unchecked(value, list(children))
 
     @staticmethod
-    def validate(string):
+    def tokenize(source, chunk_size=None):
+        """Yield (token, index) for the tokens of source, reading a file-like source chunk_size characters
+        at a time. A name that runs up to the end of a chunk is held back until the next one."""
+        if isinstance(source, str):
+            source = io.StringIO(source)
+        chunk_size = chunk_size or Parser.CHUNK_SIZE
         valid_tokens = CONST + OP + UNARY_OP + PAREN
-        for index, char in enumerate(string):
-            if char not in valid_tokens and not char.isalpha():
-                raise ValueError("Illegal token: {} at index {}".format(char, index))
-
-    def next(self):
-        self.token_index += 1
-        try:
-            return self.tokens[self.token_index - 1]
-        except IndexError:
-            return None
+        pending, offset = "", 0
+        while True:
+            chunk = source.read(chunk_size)
+            text = pending + chunk
+            pending = ""
+            for match in Parser.TOKEN.finditer(text):
+                token = match.group()
+                if chunk and match.end() == len(text) and token[0] not in valid_tokens:
+                    pending = token
+                    break
+                if len(token) == 1 and token not in valid_tokens and not token.isalpha() and token != "_":
+                    raise ValueError("Illegal token: {} at index {}".format(token, offset + match.start()))
+                yield token, offset + match.start()
+            if not chunk:
+                return
+            offset += len(text) - len(pending)
 
-    def peek(self):
-        try:
-            return self.tokens[self.token_index]
-        except IndexError:
-            return None
-
-    def parse_expr(self):
-        """expr := term (op term)*."""
-        current_expr = self.parse_term()
-        while self.peek() in OP:
-            current_expr = current_expr.binary_combined(operator=self.next(), other=self.parse_term())
-        return current_expr
-
-    def parse_term(self):
-        """term := '1' | '0' | [a-zA-Z] | '(' expr ')' | unary_op term."""
-        if self.peek() in CONST or self.peek().isalpha():
-            return Node(self.next())
-        elif self.peek() in PAREN:
-            self.next()  # (.
-            expr = self.parse_expr()
-            self.next()  # ).
-            return expr
-        elif self.peek() in UNARY_OP:
-            unary_op = self.next()
-            return self.parse_term().unary_combined(unary_op)
+    @staticmethod
+    def validate(string):
+        """Raise a ValueError for the first illegal token of string, without parsing it."""
+        for _ in Parser.tokenize(string):
+            pass
+
+    def parse(self, tokens):
+        """Build the syntax tree from (token, index) pairs. Operands are reduced as soon as they are
+        complete, so operators holds only "(", "~" and at most one binary op above each "("."""
+        operands = []
+        operators = []
+        expect_operand = True
+        for token, index in tokens:
+            if expect_operand:
+                if token in UNARY_OP or token == "(":
+                    operators.append(token)
+                    continue
+                if token in PAREN or token in OP:
+                    raise ValueError("Unexpected token: {} at index {}".format(token, index))
+                operands.append(self.make_node(token))
+            elif token in OP:
+                operators.append(token)
+                expect_operand = True
+                continue
+            elif token == ")":
+                if not operators:
+                    raise ValueError("Unmatched ) at index {}".format(index))
+                operators.pop()  # (.
+            else:
+                raise ValueError("Unexpected token: {} at index {}".format(token, index))
+            self.reduce(operands, operators)
+            expect_operand = False
+        if expect_operand:
+            raise ValueError("Unexpected end of expression")
+        while operators:
+            # close the parentheses left open, reducing like a ")" would.
+            operators.pop()
+            self.reduce(operands, operators)
+        return operands[0]
+
+    def reduce(self, operands, operators):
+        """Apply the unary ops, then the binary op, waiting on the operand just completed."""
+        while operators and operators[-1] in UNARY_OP:
+            operands.append(self.make_node(operators.pop(), [operands.pop()]))
+        if operators and operators[-1] in OP:
+            right = operands.pop()
+            operands.append(self.make_node(operators.pop(), [operands.pop(), right]))
 
     def __str__(self):
-        return self.__str__helper(self.syntax_tree)[1:-1]
-
-    def __str__helper(self, node):
-        children_strings = []
-        if not node.is_terminal():
-            for child in node.children:
-                children_strings.append(self.__str__helper(child))
-        else:
-            return node.value
-        if len(children_strings) == 1:  # unary op.
-            return "(" + node.value + children_strings[0] + ")"
-        elif len(children_strings) > 1:  # binary op.
-            return "(" + node.value.join(children_strings) + ")"
+        """Return the fully parenthesized infix form of the syntax tree, without the outermost parentheses."""
+        pieces = []
+        stack = [self.syntax_tree]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                pieces.append(item)
+            elif item.is_terminal():
+                pieces.append(item.value)
+            elif len(item.children) == 1:  # unary op.
+                stack.extend([")", item.child, item.value, "("])
+            else:  # binary op.
+                stack.append(")")
+                for child in reversed(item.children[1:]):
+                    stack.extend([child, item.value])
+                stack.extend([item.children[0], "("])
+        return "".join(pieces)[1:-1]
 
     @staticmethod
     def print_infix(node):
@@ -208,6 +589,11 @@ class Parser:
 
 class Node:
     def __init__(self, value=None, children=None):
+        # weak references to the nodes that have this node as a child, so that mutations can invalidate
+        # their cached canonical keys.
+        self._parents = []
+        self._key = None
+        self._hash = None
         self.value = value
         self.children = children
 
@@ -218,13 +604,33 @@ class Node:
     @children.setter
     def children(self, value):
         if value is None or value is []:
-            self._children = []
+            children = []
         elif isinstance(value, Node):
-            self._children = [value]
+            children = [value]
         elif isinstance(value, list) and all(isinstance(child, Node) for child in value):
-            self._children = value
+            children = value
         else:
             raise ValueError("invalid value: " + str(value))
+        for child in getattr(self, "_children", []):
+            child._parents = [parent for parent in child._parents if parent() is not self]
+        self._children = children
+        for child in children:
+            child._parents.append(weakref.ref(self))
+        self.invalidate()
+
+    @classmethod
+    def unchecked(cls, value, children):
+        """Make a node with children (a list of Nodes) without the checks of the children setter,
+        for building large trees."""
+        node = cls.__new__(cls)
+        node._parents = []
+        node._key = node._hash = None
+        node.value = value
+        node._children = children
+        parent = weakref.ref(node)
+        for child in children:
+            child._parents.append(parent)
+        return node
 
     @property
     def child(self):
@@ -261,81 +667,317 @@ class Node:
     def __eq__(self, other):
         """Return True if self and other have the same value and represent the
         same tree structure (order of children is ignored)."""
-        return hash(self) == hash(other)
+        if not isinstance(other, Node):
+            return NotImplemented
+        return self is other or (hash(self) == hash(other) and self.canonical_key() == other.canonical_key())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def canonical_key(self):
+        """Return a key that is equal for exactly the trees that are equal (i.e. ignoring the order of children):
+        (value, the sorted keys of the children). The keys (and hashes) of all the nodes in the tree are
+        cached, and only invalidated when the tree is mutated through replace_with or the children setter."""
+        if self._key is None:
+            stack = [(self, False)]
+            while stack:
+                node, children_done = stack.pop()
+                if node._key is not None:
+                    continue
+                if not children_done:
+                    stack.append((node, True))
+                    stack.extend((child, False) for child in node.children if child._key is None)
+                    continue
+                children = sorted(node.children, key=lambda child: (child._hash, child._key))
+                node._key = (node.value, tuple(child._key for child in children))
+                node._hash = hash((node.value, tuple(child._hash for child in children)))
+        return self._key
+
+    def stable_digest(self):
+        """Return a sha256 hex digest of the tree that, like canonical_key, ignores the order of children, but
+        does not depend on the hash seed of the process (the children are ordered by their digests), so it can
+        be stored across runs."""
+        digests = {}
+        stack = [(self, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if id(node) in digests:
+                continue
+            if not children_done:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children if id(child) not in digests)
+                continue
+            children = ",".join(sorted(digests[id(child)] for child in node.children))
+            digests[id(node)] = hashlib.sha256("{}({})".format(node.value, children).encode()).hexdigest()
+        return digests[id(self)]
+
+    def invalidate(self):
+        """Forget the cached canonical keys of this node and of all the nodes above it."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._key is None:
+                # the keys of the nodes above were invalidated with it, or were never computed.
+                continue
+            node._key = node._hash = None
+            stack.extend(parent() for parent in node._parents if parent() is not None)
 
     def canonicalize(self):
-        """Recursively reorder the children in the node such that all other nodes
+        """Reorder the children of every node in the tree such that all other nodes
         which are equivalent to it will have the same canonical representation after reordering."""
-        if not self.is_terminal():
-            if all(child.is_terminal() for child in self.children):
-                self.children.sort(key=lambda child: child.value)
-            else:
-                for child in self.children:
-                    child.canonicalize()
-            self.children.sort(key=lambda child: child.value + "".join(child.children_values()))
+        self.canonical_key()
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node.children.sort(key=lambda child: (child._hash, child._key))
+            stack.extend(node.children)
+
+    def __deepcopy__(self, memo):
+        root = Node(self.value)
+        stack = [(self, root)]
+        while stack:
+            source, target = stack.pop()
+            children = [Node(child.value) for child in source.children]
+            target.children = children
+            target._key, target._hash = source._key, source._hash
+            stack.extend(zip(source.children, children))
+        memo[id(self)] = root
+        return root
+
+    def __getstate__(self):
+        return self.value, self.children
+
+    def __setstate__(self, state):
+        self.__init__(*state)
 
     def __str__(self):
-        return self.__str__helper(indent=0).strip("\n")
-
-    def __str__helper(self, indent):
-        output = "  " * indent + str(self.value) + "\n"
-        if self.is_terminal():
-            return output
-        for child in self.children:
-            output += Node.__str__helper(child, indent + 1)
-        return output
+        lines = []
+        stack = [(self, 0)]
+        while stack:
+            node, indent = stack.pop()
+            lines.append("  " * indent + str(node.value))
+            stack.extend((child, indent + 1) for child in reversed(node.children))
+        return "\n".join(lines)
 
     def __hash__(self):
-        self.canonicalize()
-        return hash(self.preorder_traversal())
+        if self._hash is None:
+            self.canonical_key()
+        return self._hash
 
     def preorder_traversal(self):
-        if self.is_terminal():
-            return self.value
-        else:
-            return self.value + "".join(child.preorder_traversal() for child in self.children)
+        values = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            values.append(node.value)
+            stack.extend(reversed(node.children))
+        return "".join(values)
+
+
+def popcount(x):
+    """Return the number of 1 bits in the non-negative integer x."""
+    return bin(x).count("1")
+
+
+def set_bits(x):
+    """Return the indices of the 1 bits in the non-negative integer x in ascending order."""
+    bits = bin(x)[:1:-1]
+    indices = []
+    index = bits.find("1")
+    while index != -1:
+        indices.append(index)
+        index = bits.find("1", index + 1)
+    return indices
+
+
+def pack_bits(indices, n_bits):
+    """Return the int whose 1 bits are at the given indices (all less than n_bits). The inverse of set_bits."""
+    packed = bytearray((n_bits + 7) // 8)
+    for index in indices:
+        packed[index >> 3] |= 1 << (index & 7)
+    return int.from_bytes(bytes(packed), "little")
+
+
+class Implicant(namedtuple("Implicant", ["value", "mask"])):
+    """A product term stored as a pair of integers.
+    Bits set in mask are the "-" positions, value holds the remaining bits (with the masked bits cleared).
+    example: "01-1" -> Implicant(value=0b0101, mask=0b0010)."""
+    __slots__ = ()
+
+    @classmethod
+    def from_minterm(cls, minterm):
+        return cls(minterm, 0)
+
+    @classmethod
+    def from_bitstring(cls, bitstring):
+        """example: "01-1" -> Implicant(value=5, mask=2)."""
+        return cls(int(bitstring.replace("-", "0"), 2) if bitstring else 0,
+                   int("".join("1" if char == "-" else "0" for char in bitstring), 2) if bitstring else 0)
+
+    def bitstring(self, arity):
+        """example: Implicant(value=5, mask=2).bitstring(4) -> "01-1"."""
+        chars = []
+        for i in reversed(range(arity)):
+            if self.mask >> i & 1:
+                chars.append("-")
+            else:
+                chars.append("1" if self.value >> i & 1 else "0")
+        return "".join(chars)
+
+    @property
+    def n_ones(self):
+        return popcount(self.value)
+
+    def merged(self, other):
+        """Return the implicant covering both self and other if they differ in exactly one
+        non-dash position. Otherwise return None."""
+        if self.mask != other.mask:
+            return None
+        diff = self.value ^ other.value
+        if popcount(diff) != 1:
+            return None
+        return Implicant(self.value & ~diff, self.mask | diff)
+
+    def covers(self, minterm):
+        """Returns True if the minterm (an int) is one of the minterms of this implicant."""
+        return minterm & ~self.mask == self.value
+
+    def contains(self, other):
+        """Returns True if every minterm of the implicant other is one of the minterms of this implicant."""
+        return other.mask & ~self.mask == 0 and other.value & ~self.mask == self.value
+
+    def minterms(self):
+        """Yield the minterms of this implicant, by iterating over the submasks of its mask."""
+        submask = self.mask
+        while True:
+            yield self.value | submask
+            if submask == 0:
+                break
+            submask = (submask - 1) & self.mask
+
+
+def check_terms(terms, arity):
+    """Raise a ValueError if any of the terms (ints) is not an input of a function of arity variables."""
+    for term in terms:
+        if not 0 <= term < 2 ** arity:
+            raise ValueError("Term out of range for {} variables: {}".format(arity, term))
 
 
 class PrimeImplicantTable:
-    def __init__(self, minterms, prime_implicants):
-        self.minterms = list(minterms)
-        self.prime_implicants = list(prime_implicants)
-        self.prime_implicant_table = [
-            [self.matches(minterm, prime_implicant) for prime_implicant in self.prime_implicants]
-            for minterm in minterms]
+    """Rows are minterms and columns are prime implicants.
+    Every row and every column is stored as an int bitset. Removing rows or columns clears them from
+    the active masks instead of popping them, so an index keeps referring to the same row or column
+    for the lifetime of the table. row(), col() and __str__ only show the active rows and columns.
+    minterms and prime_implicants may be given as bitstrings, or as ints and Implicants with arity."""
+    def __init__(self, minterms, prime_implicants, arity=None):
+        self.all_minterms = list(minterms)
+        self.all_prime_implicants = list(prime_implicants)
+        if arity is None:
+            arity = len(self.all_prime_implicants[0] if self.all_prime_implicants else
+                        self.all_minterms[0] if self.all_minterms else "")
+        self.arity = arity
+        minterm_values = [int(minterm, 2) if isinstance(minterm, str) else minterm for minterm in self.all_minterms]
+        implicants = [Implicant.from_bitstring(implicant) if isinstance(implicant, str) else implicant
+                      for implicant in self.all_prime_implicants]
+        row_lookup = {minterm: index for index, minterm in enumerate(minterm_values)}
+        self.rows = [0] * len(minterm_values)
+        self.cols = [0] * len(implicants)
+        for col_index, implicant in enumerate(implicants):
+            col = 0
+            if 2 ** popcount(implicant.mask) < len(minterm_values):
+                for minterm in implicant.minterms():
+                    row_index = row_lookup.get(minterm)
+                    if row_index is not None:
+                        col |= 1 << row_index
+            else:
+                for row_index, minterm in enumerate(minterm_values):
+                    if implicant.covers(minterm):
+                        col |= 1 << row_index
+            self.cols[col_index] = col
+            for row_index in set_bits(col):
+                self.rows[row_index] |= 1 << col_index
+        self.active_rows = (1 << len(self.rows)) - 1
+        self.active_cols = (1 << len(self.cols)) - 1
+        # (pass name, number of comparisons, number of removals, seconds) for each reduction pass.
+        self.dominance_passes = []
+
+    @classmethod
+    def from_rows(cls, minterms, prime_implicants, rows, arity):
+        """Make a table from a precomputed coverage relation: rows[i] is the bitset of the columns
+        that cover minterms[i]."""
+        pit = cls([], [], arity)
+        pit.all_minterms = list(minterms)
+        pit.all_prime_implicants = list(prime_implicants)
+        pit.rows = list(rows)
+        pit.cols = [0] * len(pit.all_prime_implicants)
+        for row_index, row in enumerate(pit.rows):
+            for col_index in set_bits(row):
+                pit.cols[col_index] |= 1 << row_index
+        pit.active_rows = (1 << len(pit.rows)) - 1
+        pit.active_cols = (1 << len(pit.cols)) - 1
+        return pit
 
     @property
     def n_rows(self):
-        return len(self.minterms)
+        return popcount(self.active_rows)
 
     @property
     def n_cols(self):
-        return len(self.prime_implicants)
+        return popcount(self.active_cols)
+
+    @property
+    def minterms(self):
+        return [self.all_minterms[index] for index in self.row_indices()]
+
+    @property
+    def prime_implicants(self):
+        return [self.all_prime_implicants[index] for index in self.col_indices()]
+
+    def row_indices(self):
+        return set_bits(self.active_rows)
+
+    def col_indices(self):
+        return set_bits(self.active_cols)
+
+    def row_bits(self, index):
+        """Return the active columns that cover the minterm of row index as a bitset."""
+        return self.rows[index] & self.active_cols
+
+    def col_bits(self, index):
+        """Return the active rows that are covered by the prime implicant of column index as a bitset."""
+        return self.cols[index] & self.active_rows
 
     def col(self, index):
-        return [row[index] for row in self.prime_implicant_table]
+        col = self.col_bits(index)
+        return [col >> row_index & 1 == 1 for row_index in self.row_indices()]
 
     def row(self, index):
-        return self.prime_implicant_table[index]
+        row = self.row_bits(index)
+        return [row >> col_index & 1 == 1 for col_index in self.col_indices()]
 
     def remove_cols(self, indices):
         """Remove the columns and corresponding prime implicants at the indices specified by indices."""
-        for col in reversed(sorted(indices)):
-            for row in self.prime_implicant_table:
-                row.pop(col)
-            self.prime_implicants.pop(col)
+        for index in indices:
+            self.active_cols &= ~(1 << index)
 
     def remove_rows(self, indices):
         """Remove the rows and corresponding minterms at the indices specified by indices."""
-        for row in reversed(sorted(indices)):
-            self.prime_implicant_table.pop(row)
-            self.minterms.pop(row)
+        for index in indices:
+            self.active_rows &= ~(1 << index)
+
+    def log_pass(self, name, comparisons, removals, seconds):
+        self.dominance_passes.append((name, comparisons, removals, seconds))
 
     def __str__(self):
-        col_width = len(self.prime_implicants[0]) + 1
-        rows = ["".join(prime_implicant.ljust(col_width) for prime_implicant in ["", ""] + self.prime_implicants)]
-        for i in range(self.n_rows):
-            minterm = self.minterms[i]
+        as_bitstring = lambda term: term if isinstance(term, str) else term.bitstring(self.arity)
+        col_width = self.arity + 1
+        rows = ["".join(prime_implicant.ljust(col_width) for prime_implicant in
+                        ["", ""] + [as_bitstring(prime_implicant) for prime_implicant in self.prime_implicants])]
+        for i in self.row_indices():
+            minterm = self.all_minterms[i]
+            if not isinstance(minterm, str):
+                minterm = Implicant.from_minterm(minterm).bitstring(self.arity)
             bool_values = self.row(i)
             rows.append(str(int(minterm, 2)).ljust(col_width) +
                         minterm.ljust(col_width) + "".join("|" +